@@ -0,0 +1,360 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+MEMORY = ':memory:'
+# Событие сброса всего кэша
+CLEAR_ALL = '*'
+# Размер пачки ключей в запросах IN (...)
+KEYS_PER_QUERY = 500
+# Раз в сколько событий удалять старые записи журнала,
+# истёкшие записи L2 и записи сверх MAX_ENTRIES
+PRUNE_EVERY = 1000
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entry ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)',
+    'CREATE TABLE IF NOT EXISTS cache_event ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL,'
+    ' origin TEXT NOT NULL, created REAL NOT NULL)',
+)
+
+
+class LocalTier:
+    """L1: ограниченный LRU-словарь одного процесса.
+
+    Хранит сериализованные значения, чтобы вызывающий код
+    получал независимую копию, как из LocMemCache.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Процесс узнаёт свои события в журнале по origin
+        self.origin = uuid.uuid4().hex
+        self.last_event = None
+        self.synced_at = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, expires):
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def drop(self, keys):
+        with self.lock:
+            for key in keys:
+                if key == CLEAR_ALL:
+                    self.entries.clear()
+                else:
+                    self.entries.pop(key, None)
+
+
+# L1 общий для потоков процесса: экземпляры бэкенда у каждого потока свои
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+# Соединения, которые держат открытой базу в памяти
+_memory_keepers = {}
+
+
+class TwoTierCache(BaseCache):
+    """Двухуровневый кэш: L1 в памяти процесса и общий L2 в SQLite.
+
+    LOCATION - путь к файлу базы L2 или ':memory:' (база в памяти,
+    общая для потоков одного процесса; для тестов).
+
+    Каждая запись и удаление добавляют ключ в журнал cache_event
+    в L2. Перед чтением процесс просматривает новые события
+    (не чаще SYNC_INTERVAL секунд) и удаляет эти ключи из своего L1,
+    поэтому изменение в одном процессе видно остальным не позже
+    чем через SYNC_INTERVAL. Записи L1 живут не дольше L1_TIMEOUT
+    секунд; журнал хранится LOG_TIMEOUT секунд, что должно быть
+    больше L1_TIMEOUT.
+
+    Каждые PRUNE_EVERY событий из L2 удаляются истёкшие записи,
+    а если их больше MAX_ENTRIES - те, что истекут раньше всех.
+
+    add() и incr() атомарны между процессами.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._location = location or MEMORY
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 60))
+        # Без паузы каждое чтение из L1 обращалось бы к журналу в L2
+        self._sync_interval = min(
+            float(options.get('SYNC_INTERVAL', 1)), self._l1_timeout
+        )
+        self._log_timeout = max(
+            float(options.get('LOG_TIMEOUT', 600)), self._l1_timeout
+        )
+        self._l1 = self._local_tier(int(options.get('L1_MAX_ENTRIES', 1000)))
+        self._connection = None
+        self._pid = None
+
+    def _local_tier(self, max_entries):
+        with _local_tiers_lock:
+            tier = _local_tiers.get(self._location)
+            if tier is None:
+                tier = _local_tiers[self._location] = LocalTier(max_entries)
+            return tier
+
+    def _connect(self):
+        if self._location == MEMORY:
+            name = f'file:twotier-{os.getpid()}?mode=memory&cache=shared'
+            connection = sqlite3.connect(
+                name, uri=True, isolation_level=None, check_same_thread=False
+            )
+            _memory_keepers.setdefault(name, connection)
+        else:
+            connection = sqlite3.connect(
+                self._location, timeout=30, isolation_level=None,
+                check_same_thread=False
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            connection.execute(statement)
+        return connection
+
+    @property
+    def _db(self):
+        # После fork соединение родителя не используется
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = self._connect()
+            self._pid = os.getpid()
+        return self._connection
+
+    @contextmanager
+    def _atomic(self):
+        """Транзакция L2 с блокировкой записи с самого начала."""
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _expires(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return None if expires is None else float(expires)
+
+    def _remember(self, key, value, expires):
+        l1_expires = time.time() + self._l1_timeout
+        if expires is not None:
+            l1_expires = min(l1_expires, expires)
+        self._l1.set(key, value, l1_expires)
+
+    def _publish(self, db, keys):
+        now = time.time()
+        cursor = db.executemany(
+            'INSERT INTO cache_event (key, origin, created) VALUES (?, ?, ?)',
+            [(key, self._l1.origin, now) for key in keys]
+        )
+        last_id = db.execute('SELECT last_insert_rowid()').fetchone()[0]
+        first_id = last_id - cursor.rowcount + 1
+        # L2 чистится, когда номер события переходит через PRUNE_EVERY
+        if last_id // PRUNE_EVERY != (first_id - 1) // PRUNE_EVERY:
+            self._prune(db, now)
+
+    def _prune(self, db, now):
+        db.execute(
+            'DELETE FROM cache_event WHERE created < ?',
+            (now - self._log_timeout,)
+        )
+        db.execute('DELETE FROM cache_entry WHERE expires <= ?', (now,))
+        count = db.execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+        if count > self._max_entries:
+            # Бессрочные записи (поколения страниц) удаляются последними
+            db.execute(
+                'DELETE FROM cache_entry WHERE key IN ('
+                ' SELECT key FROM cache_entry'
+                ' ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count - self._max_entries,)
+            )
+
+    def _sync(self):
+        """Удаляет из L1 ключи, изменённые другими процессами."""
+        tier = self._l1
+        if time.monotonic() - tier.synced_at < self._sync_interval:
+            return
+        tier.synced_at = time.monotonic()
+        if tier.last_event is None:
+            # Что менялось до первой сверки, неизвестно: L1 сбрасывается
+            row = self._db.execute('SELECT MAX(id) FROM cache_event')
+            tier.last_event = row.fetchone()[0] or 0
+            tier.drop([CLEAR_ALL])
+            return
+        rows = self._db.execute(
+            'SELECT id, key, origin FROM cache_event WHERE id > ? '
+            'ORDER BY id', (tier.last_event,)
+        ).fetchall()
+        if rows:
+            tier.drop(key for _, key, origin in rows if origin != tier.origin)
+            tier.last_event = rows[-1][0]
+
+    def _fetch(self, keys):
+        """Действующие значения ключей из L2 с переносом в L1."""
+        found = {}
+        now = time.time()
+        for start in range(0, len(keys), KEYS_PER_QUERY):
+            chunk = keys[start:start + KEYS_PER_QUERY]
+            rows = self._db.execute(
+                'SELECT key, value, expires FROM cache_entry '
+                f'WHERE key IN ({", ".join("?" * len(chunk))})', chunk
+            )
+            for key, value, expires in rows:
+                if expires is None or expires > now:
+                    found[key] = value
+                    self._remember(key, value, expires)
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        self._sync()
+        value = self._l1.get(key)
+        if value is None:
+            value = self._fetch([key]).get(key)
+        if value is None:
+            return default
+        return pickle.loads(value)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        self._sync()
+        values = {}
+        missing = []
+        for key in keys:
+            value = self._l1.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                values[key] = value
+        if missing:
+            values.update(self._fetch(missing))
+        return {
+            keys[key]: pickle.loads(value) for key, value in values.items()
+        }
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def _write(self, db, key, value, timeout):
+        """Записывает значение в L2, возвращает (pickle, срок)."""
+        expires = self._expires(timeout)
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        db.execute(
+            'INSERT OR REPLACE INTO cache_entry (key, value, expires) '
+            'VALUES (?, ?, ?)', (key, pickled, expires)
+        )
+        return pickled, expires
+
+    def _alive(self, db, key):
+        """Строка (value, expires) неистёкшей записи L2 или None."""
+        row = db.execute(
+            'SELECT value, expires FROM cache_entry WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return row
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        data = {self._key(key, version): value for key, value in data.items()}
+        with self._atomic() as db:
+            written = {
+                key: self._write(db, key, value, timeout)
+                for key, value in data.items()
+            }
+            self._publish(db, list(written))
+        for key, (pickled, expires) in written.items():
+            self._remember(key, pickled, expires)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._atomic() as db:
+            if self._alive(db, key) is not None:
+                return False
+            pickled, expires = self._write(db, key, value, timeout)
+            self._publish(db, [key])
+        self._remember(key, pickled, expires)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._atomic() as db:
+            row = self._alive(db, key)
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            db.execute(
+                'UPDATE cache_entry SET value = ? WHERE key = ?',
+                (pickled, key)
+            )
+            self._publish(db, [key])
+        self._remember(key, pickled, row[1])
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._atomic() as db:
+            touched = self._alive(db, key) is not None
+            if touched:
+                db.execute(
+                    'UPDATE cache_entry SET expires = ? WHERE key = ?',
+                    (self._expires(timeout), key)
+                )
+                self._publish(db, [key])
+        self._l1.drop([key])
+        return touched
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._atomic() as db:
+            db.executemany(
+                'DELETE FROM cache_entry WHERE key = ?',
+                [(key,) for key in keys]
+            )
+            self._publish(db, keys)
+        self._l1.drop(keys)
+
+    def clear(self):
+        with self._atomic() as db:
+            db.execute('DELETE FROM cache_entry')
+            self._publish(db, [CLEAR_ALL])
+        self._l1.drop([CLEAR_ALL])
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.replicas import PRIMARY, copy_database, mark_synced
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файлы реплик.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять копирование каждые N секунд; 0 - один раз.'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            self.stdout.write(
+                'Реплики не настроены: задайте YATUBE_DB_REPLICAS'
+            )
+            return
+        source = settings.DATABASES[PRIMARY]['NAME']
+        while True:
+            # Записи, сделанные во время копирования, могут
+            # не попасть в копию, поэтому отмечается время начала
+            started = time.time()
+            for alias in settings.DATABASE_REPLICAS:
+                copy_database(source, settings.DATABASES[alias]['NAME'])
+                self.stdout.write(f'{alias}: скопировано')
+            mark_synced(started)
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
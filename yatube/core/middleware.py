@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+
+from .replicas import STICKY_COOKIE, replicas_behind, use_primary
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _written_at(request):
+    """Время последней записи пользователя из cookie или None."""
+    try:
+        return float(request.COOKIES[STICKY_COOKIE])
+    except (KeyError, ValueError):
+        return None
+
+
+class PrimaryStickyMiddleware:
+    """Читает с основной базы запросы, которые пишут, и запросы
+    пользователя, пока реплики не получили его последнюю запись.
+
+    Так автор сразу видит свой пост или комментарий, даже если
+    реплики ещё не обновились.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method not in SAFE_METHODS
+        written = _written_at(request)
+        sticky = written is not None and replicas_behind(written)
+        with use_primary(writes or sticky):
+            response = self.get_response(request)
+        if not settings.DATABASE_REPLICAS:
+            return response
+        if writes:
+            # Время после ответа не раньше всех записей запроса
+            response.set_cookie(
+                STICKY_COOKIE, repr(time.time()), httponly=True
+            )
+        elif STICKY_COOKIE in request.COOKIES and not sticky:
+            response.delete_cookie(STICKY_COOKIE)
+        return response
@@ -0,0 +1,102 @@
+import random
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+PRIMARY = DEFAULT_DB_ALIAS
+# Cookie со временем последней записи пользователя: пока реплики
+# её не получили, пользователь читает с основной базы
+STICKY_COOKIE = 'use_primary'
+# Время последней записи и время, на которое сняты копии реплик
+WRITTEN_KEY = 'replicas:written_at'
+SYNCED_KEY = 'replicas:synced_at'
+
+_use_primary = ContextVar('use_primary', default=False)
+
+
+@contextmanager
+def use_primary(enabled=True):
+    """Направляет чтение внутри блока в основную базу."""
+    token = _use_primary.set(enabled or _use_primary.get())
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Запись - в основную базу, чтение - в случайную реплику.
+
+    Реплики перечислены в DATABASE_REPLICAS, с них читаются только
+    модели из REPLICA_MODELS. Если реплик нет или чтение идёт
+    внутри use_primary(), читается основная база.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or _use_primary.get():
+            return PRIMARY
+        if model._meta.label_lower not in settings.REPLICA_MODELS:
+            return PRIMARY
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        # Объект из другой базы, кроме реплик (например, шарда
+        # постов), записывается туда же, откуда прочитан
+        instance = hints.get('instance')
+        database = instance._state.db if instance is not None else None
+        if database and database not in settings.DATABASE_REPLICAS:
+            return database
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы, связи между ними допустимы
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными основной базы
+        return db not in settings.DATABASE_REPLICAS
+
+
+def mark_written():
+    """Отмечает запись, которой ещё нет в репликах."""
+    cache.set(WRITTEN_KEY, time.time(), None)
+
+
+def mark_synced(started):
+    """Отмечает, что реплики содержат все записи до started."""
+    cache.set(SYNCED_KEY, started, None)
+
+
+def replicas_behind(written=None):
+    """Отстают ли реплики от записи, сделанной до момента written.
+
+    По умолчанию - от последней отмеченной записи.
+    """
+    if not settings.DATABASE_REPLICAS:
+        return False
+    if written is None:
+        written = cache.get(WRITTEN_KEY)
+    return written is not None and written >= cache.get(SYNCED_KEY, 0)
+
+
+def copy_database(source, target):
+    """Копирует базу SQLite source в файл target.
+
+    Копия пишется backup API прямо в файл реплики одной
+    транзакцией: открытые соединения читателей (в том числе
+    постоянные, с CONN_MAX_AGE) видят либо старую, либо новую
+    базу целиком.
+    """
+    with closing(sqlite3.connect(source)) as source_db, \
+            closing(sqlite3.connect(target)) as target_db:
+        source_db.backup(target_db)
+        # Реплика только читается, WAL-файлы рядом с ней не нужны
+        target_db.execute('PRAGMA journal_mode=DELETE')
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .replicas import PRIMARY, mark_written
+
+# Настройки файла базы: на репликах их не меняют
+FILE_PRAGMAS = ('journal_mode', 'synchronous')
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Выполняет PRAGMA из SQLITE_PRAGMAS для нового соединения."""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    pragmas = settings.SQLITE_PRAGMAS.items()
+    if connection.alias in settings.DATABASE_REPLICAS:
+        pragmas = [
+            (name, value) for name, value in pragmas
+            if name not in FILE_PRAGMAS
+        ]
+    with connection.cursor() as cursor:
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def mark_replicas_behind(sender, using, **kwargs):
+    """Любая запись в основную базу, включая сессии, делает реплики
+    отстающими до следующей синхронизации."""
+    if settings.DATABASE_REPLICAS and using == PRIMARY:
+        mark_written()
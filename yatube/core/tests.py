@@ -1,6 +1,29 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
 from http import HTTPStatus
+from unittest import mock
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from posts.models import Group, Post
+
+from .cache import LocalTier, TwoTierCache
+from .middleware import PrimaryStickyMiddleware
+from .replicas import (PRIMARY, STICKY_COOKIE, PrimaryReplicaRouter,
+                       copy_database, mark_synced, mark_written,
+                       replicas_behind)
+from .signals import apply_sqlite_pragmas
+
+User = get_user_model()
 
 
 class ViewTestClass(TestCase):
@@ -10,3 +33,217 @@ class ViewTestClass(TestCase):
         # Проверьте, что используется шаблон core/404.html
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class TwoTierCacheTest(TestCase):
+    """Два экземпляра с разными L1 над одной базой - как два процесса."""
+
+    def setUp(self):
+        self.location = os.path.join(tempfile.mkdtemp(), 'cache.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.location))
+        self.first = self.make_cache()
+        self.second = self.make_cache()
+
+    def make_cache(self, **options):
+        # Сверка с журналом при каждом чтении
+        options.setdefault('SYNC_INTERVAL', 0)
+        cache = TwoTierCache(self.location, {'OPTIONS': options})
+        # Свой L1, как у отдельного процесса
+        cache._l1 = LocalTier(options.get('L1_MAX_ENTRIES', 1000))
+        return cache
+
+    def test_value_is_shared_through_l2(self):
+        self.first.set('key', {'value': 1})
+        self.assertEqual(self.second.get('key'), {'value': 1})
+        self.assertEqual(self.second.get_many(['key', 'missing']), {
+            'key': {'value': 1}
+        })
+
+    def test_repeated_get_is_served_from_l1(self):
+        self.first.set('key', 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        with mock.patch.object(self.second, '_fetch') as fetch:
+            self.assertEqual(self.second.get('key'), 'value')
+        fetch.assert_not_called()
+
+    def test_invalidation_drops_other_l1(self):
+        """Запись и удаление в одном процессе видны в другом сразу,
+        хотя значение уже лежит в его L1."""
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+        self.second.set('other', 'value')
+        self.assertEqual(self.first.get('other'), 'value')
+        self.second.clear()
+        self.assertIsNone(self.first.get('other'))
+
+    def test_journal_is_read_once_per_sync_interval(self):
+        cache = self.make_cache(SYNC_INTERVAL=60)
+        self.first.set('key', 'old')
+        self.assertEqual(cache.get('key'), 'old')
+        self.first.set('key', 'new')
+        with mock.patch.object(cache, '_fetch') as fetch:
+            self.assertEqual(cache.get('key'), 'old')
+        fetch.assert_not_called()
+
+    def test_prune_removes_expired_and_extra_entries(self):
+        cache = self.make_cache(MAX_ENTRIES=2)
+        cache.set('expired', 1, timeout=-1)
+        cache.set('soon', 2, timeout=10)
+        cache.set('later', 3, timeout=20)
+        cache.set('forever', 4, timeout=None)
+        with cache._atomic() as db:
+            cache._prune(db, time.time())
+            keys = db.execute('SELECT key FROM cache_entry').fetchall()
+        self.assertCountEqual(keys, [
+            (cache.make_key('later'),), (cache.make_key('forever'),)
+        ])
+
+    def test_add_and_incr_are_atomic(self):
+        self.assertTrue(self.first.add('counter', 1))
+        self.assertFalse(self.second.add('counter', 5))
+        self.assertEqual(self.second.incr('counter'), 2)
+        self.assertEqual(self.first.incr('counter', 3), 5)
+        self.assertEqual(self.second.get('counter'), 5)
+        with self.assertRaises(ValueError):
+            self.first.incr('missing')
+
+    def test_expired_value_is_not_returned(self):
+        self.first.set('key', 'value', timeout=-1)
+        self.assertIsNone(self.second.get('key'))
+        self.assertTrue(self.second.add('key', 'value'))
+
+    def test_l1_size_is_bounded(self):
+        cache = self.make_cache(L1_MAX_ENTRIES=2)
+        cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(list(cache._l1.entries), [
+            cache.make_key('b'), cache.make_key('c')
+        ])
+        self.assertEqual(cache.get('a'), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, request):
+        """Базу чтения, выбранную при обработке запроса."""
+        databases = []
+
+        def view(request):
+            databases.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        response = PrimaryStickyMiddleware(view)(request)
+        return databases[0], response
+
+    def test_reads_go_to_replica(self):
+        database, response = self.route(self.factory.get('/'))
+        self.assertEqual(database, 'replica_1')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.router.db_for_write(None), PRIMARY)
+
+    def test_write_request_sticks_to_primary(self):
+        """После записи пользователь читает с основной базы,
+        пока реплики её не получат."""
+        cache.clear()
+        database, response = self.route(self.factory.post('/'))
+        self.assertEqual(database, PRIMARY)
+        request = self.factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = response.cookies[STICKY_COOKIE].value
+        database, response = self.route(request)
+        self.assertEqual(database, PRIMARY)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        mark_synced(time.time())
+        database, response = self.route(request)
+        self.assertEqual(database, 'replica_1')
+        self.assertEqual(response.cookies[STICKY_COOKIE].value, '')
+
+    def test_sessions_and_users_are_read_from_primary(self):
+        self.assertEqual(self.router.db_for_read(Session), PRIMARY)
+        self.assertEqual(self.router.db_for_read(User), PRIMARY)
+        self.assertEqual(self.router.db_for_read(Group), 'replica_1')
+
+    def test_any_write_marks_replicas_behind(self):
+        cache.clear()
+        mark_synced(time.time())
+        User.objects.create_user(username='writer')
+        self.assertTrue(replicas_behind())
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_primary(self):
+        database, response = self.route(self.factory.post('/'))
+        self.assertEqual(database, PRIMARY)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.router.db_for_read(Post), PRIMARY)
+
+    def test_copy_database(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source = os.path.join(directory, 'db.sqlite3')
+        target = os.path.join(directory, 'replica.sqlite3')
+        with closing(sqlite3.connect(source)) as db:
+            db.execute('CREATE TABLE post (text TEXT)')
+            db.execute("INSERT INTO post VALUES ('first')")
+            db.commit()
+        copy_database(source, target)
+        with closing(sqlite3.connect(target)) as replica:
+            self.assertEqual(
+                replica.execute('SELECT text FROM post').fetchall(),
+                [('first',)]
+            )
+            # Открытое соединение читателя видит следующую копию
+            with closing(sqlite3.connect(source)) as db:
+                db.execute("INSERT INTO post VALUES ('second')")
+                db.commit()
+            copy_database(source, target)
+            self.assertEqual(
+                replica.execute('SELECT COUNT(*) FROM post').fetchone(), (2,)
+            )
+        self.assertEqual(sorted(os.listdir(directory)), [
+            'db.sqlite3', 'replica.sqlite3'
+        ])
+
+    def test_replicas_behind_until_synced(self):
+        cache.clear()
+        self.assertFalse(replicas_behind())
+        started = time.time()
+        mark_written()
+        self.assertTrue(replicas_behind())
+        mark_synced(started)
+        self.assertTrue(replicas_behind())
+        mark_synced(time.time())
+        self.assertFalse(replicas_behind())
+
+
+class SqlitePragmasTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def setUp(self):
+        cache_size = self.pragma('cache_size')
+        self.addCleanup(
+            connection.cursor().execute, f'PRAGMA cache_size = {cache_size}'
+        )
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -1024})
+    def test_pragmas_are_applied(self):
+        apply_sqlite_pragmas(sender=None, connection=connection)
+        self.assertEqual(self.pragma('cache_size'), -1024)
+
+    @override_settings(
+        SQLITE_PRAGMAS={'journal_mode': 'WAL', 'cache_size': -1024},
+        DATABASE_REPLICAS=[PRIMARY]
+    )
+    def test_replica_file_is_not_changed(self):
+        journal_mode = self.pragma('journal_mode')
+        apply_sqlite_pragmas(sender=None, connection=connection)
+        self.assertEqual(self.pragma('journal_mode'), journal_mode)
+        self.assertEqual(self.pragma('cache_size'), -1024)
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Comment, Group, Post, Follow
 
 
@@ -10,6 +11,18 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по тексту идёт через поисковый индекс постов.
+
+        Находятся все подходящие посты: список сам их сортирует
+        и разбивает на страницы.
+        """
+        if not search_term:
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return search.filter_posts(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("title",)}
@@ -0,0 +1,238 @@
+import random
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished, request_started
+from django.db import OperationalError, connection, connections, transaction
+from django.utils import timezone
+
+from .models import FeedEntry, Follow, Group, Post
+
+User = get_user_model()
+
+# Индексы, которые сравниваются в бенчмарке лент
+FEED_INDEXES = (
+    (Post, 'post_group_pub_date_idx'),
+    (Post, 'post_author_pub_date_idx'),
+    (Follow, 'follow_author_user_idx'),
+    (FeedEntry, 'feed_user_pub_date_post_idx'),
+)
+# За сколько дней до текущего момента разбросаны даты постов
+DATASET_DAYS = 3 * 365
+# Через сколько секунд после запуска пула процессы начинают нагрузку
+WORKLOAD_START_DELAY = 2
+
+
+def _insert(model, fields, rows):
+    """Вставляет строки одним executemany в одной транзакции,
+    минуя save() и сигналы."""
+    columns = ', '.join(
+        connection.ops.quote_name(model._meta.get_field(name).column)
+        for name in fields
+    )
+    placeholders = ', '.join(['%s'] * len(fields))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} '
+            f'({columns}) VALUES ({placeholders})', rows
+        )
+
+
+def generate_dataset(posts, users, groups, follows, batch_size=10000,
+                     seed=0):
+    """Заполняет базу случайными пользователями, группами,
+    подписками и постами.
+
+    У каждого пользователя до follows подписок; примерно
+    у трёх постов из четырёх есть группа. Ленты подписок
+    получают все посты авторов, как при рассылке; счётчики
+    и поисковый индекс не заполняются.
+    """
+    rng = random.Random(seed)
+    # Размер пачек пользователей и подписок выбирает бэкенд базы,
+    # batch_size относится к постам
+    User.objects.bulk_create(
+        User(username=f'bench_{i}', password='!') for i in range(users)
+    )
+    Group.objects.bulk_create(
+        (
+            Group(title=f'Группа {i}', slug=f'bench-{i}', description='')
+            for i in range(groups)
+        )
+    )
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    group_ids = list(Group.objects.values_list('pk', flat=True))
+    Follow.objects.bulk_create(
+        (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in set(
+                rng.sample(user_ids, min(follows, len(user_ids)))
+            ) - {user_id}
+        ),
+        ignore_conflicts=True
+    )
+    pub_date_field = Post._meta.get_field('pub_date')
+    start = timezone.now() - timedelta(days=DATASET_DAYS)
+    seconds = DATASET_DAYS * 24 * 60 * 60
+    fields = ('text', 'pub_date', 'updated', 'group', 'author', 'image',
+              'image_renditions', 'image_format', 'image_hash',
+              'comments_count')
+    for first in range(0, posts, batch_size):
+        rows = []
+        for i in range(first, min(first + batch_size, posts)):
+            pub_date = pub_date_field.get_db_prep_save(
+                start + timedelta(seconds=rng.randrange(seconds)), connection
+            )
+            group_id = rng.choice(group_ids) if rng.random() < 0.75 else None
+            rows.append((
+                f'Пост {i}', pub_date, pub_date, group_id,
+                rng.choice(user_ids), '', '', '', '', 0
+            ))
+        _insert(Post, fields, rows)
+    _fill_feeds()
+    analyze()
+
+
+def _fill_feeds():
+    """Записи лент подписок одним INSERT ... SELECT."""
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {qn(FeedEntry._meta.db_table)} '
+            f'(user_id, post_id, pub_date) '
+            f'SELECT follow.user_id, post.id, post.pub_date '
+            f'FROM {qn(Follow._meta.db_table)} AS follow '
+            f'JOIN {qn(Post._meta.db_table)} AS post '
+            f'ON post.author_id = follow.author_id'
+        )
+
+
+def analyze():
+    """Обновляет статистику планировщика запросов."""
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def _index(model, name):
+    return next(index for index in model._meta.indexes if index.name == name)
+
+
+def drop_indexes(indexes=FEED_INDEXES):
+    with connection.schema_editor() as editor:
+        for model, name in indexes:
+            editor.remove_index(model, _index(model, name))
+    analyze()
+
+
+def create_indexes(indexes=FEED_INDEXES):
+    with connection.schema_editor() as editor:
+        for model, name in indexes:
+            editor.add_index(model, _index(model, name))
+    analyze()
+
+
+def access_paths():
+    """Первые страницы лент в том виде, в каком их строят представления.
+
+    Группа и автор берутся у первого поста с группой,
+    читатель - у первой подписки.
+    """
+    post = Post.objects.filter(group__isnull=False).order_by('pk').first()
+    reader = Follow.objects.order_by('pk').first().user
+    # Лента подписок читает ключи постов из записей ленты,
+    # сами посты страницы загружаются затем по первичному ключу
+    followed = FeedEntry.objects.filter(user=reader).order_by(
+        '-pub_date', '-post_id'
+    ).values_list('pub_date', 'post_id')
+    return {
+        'index': Post.objects.for_feed(),
+        'group_posts': post.group.posts.for_feed(),
+        'profile': post.author.posts.for_feed(),
+        'follow_index': followed,
+    }
+
+
+def measure(queryset, repeat=5):
+    """План запроса первой страницы и время его выполнения, мс."""
+    page = queryset[:settings.SHOW_POSTS]
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(page.all())
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'plan': page.explain(),
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+    }
+
+
+def _workload(role, pragmas, conn_max_age, started, deadline):
+    """Процесс нагрузки: читает ленту или публикует посты до deadline.
+
+    Каждая операция оформлена как отдельный запрос: по сигналам
+    запроса соединение закрывается, если CONN_MAX_AGE = 0.
+    Возвращает число операций и ошибок «database is locked».
+    """
+    settings.SQLITE_PRAGMAS = pragmas
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    author_id = User.objects.values_list('pk', flat=True).first()
+    request_finished.send(sender=None)
+    time.sleep(max(started - time.time(), 0))
+    done = locked = 0
+    while time.time() < deadline:
+        request_started.send(sender=None)
+        try:
+            if role == 'read':
+                list(Post.objects.for_feed()[:settings.SHOW_POSTS])
+            else:
+                Post.objects.bulk_create(
+                    [Post(text='Новый пост', author_id=author_id)]
+                )
+            done += 1
+        except OperationalError:
+            locked += 1
+        finally:
+            request_finished.send(sender=None)
+    connection.close()
+    return role, done, locked
+
+
+def concurrent_workload(readers, writers, duration, pragmas, conn_max_age):
+    """Одновременные чтения ленты и публикации постов в процессах.
+
+    Возвращает операции в секунду по ролям и число ошибок блокировки.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'PRAGMA journal_mode = {pragmas.get("journal_mode", "DELETE")}'
+        )
+    # Процессы пула не должны унаследовать открытое соединение
+    connections.close_all()
+    started = time.time() + WORKLOAD_START_DELAY
+    roles = ['read'] * readers + ['write'] * writers
+    with ProcessPoolExecutor(max_workers=len(roles)) as executor:
+        futures = [
+            executor.submit(
+                _workload, role, pragmas, conn_max_age,
+                started, started + duration
+            )
+            for role in roles
+        ]
+        results = [future.result() for future in futures]
+    done = Counter()
+    locked = 0
+    for role, role_done, role_locked in results:
+        done[role] += role_done
+        locked += role_locked
+    return {
+        'reads_per_second': round(done['read'] / duration, 1),
+        'writes_per_second': round(done['write'] / duration, 1),
+        'locked': locked,
+    }
@@ -0,0 +1,223 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import quote_etag
+
+from core.replicas import mark_written, replicas_behind, use_primary
+
+from .fragments import stitch, viewer_key
+
+GENERATION_KEY = 'posts:generation:{}'
+LOCK_POLL_INTERVAL = 0.05
+
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+def _count(event):
+    with _metrics_lock:
+        _metrics[event] += 1
+
+
+def get_metrics():
+    """Счётчики кэша страниц в текущем процессе.
+
+    hits - ответ из кэша, misses - страница построена заново,
+    stale - отдана устаревшая копия, пока другой запрос её обновляет,
+    lock_waits - запрос ждал, пока страницу построит другой запрос.
+    """
+    with _metrics_lock:
+        return {
+            event: _metrics[event]
+            for event in ('hits', 'misses', 'stale', 'lock_waits')
+        }
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def feed_scope(name, value=None):
+    """Имя области кэша: 'index', 'group:<slug>' или 'author:<username>'."""
+    if value is None:
+        return name
+    return f'{name}:{value}'
+
+
+def _new_generation():
+    # Поколение от времени: после вытеснения ключа из кэша
+    # новое значение не совпадёт со старым
+    return int(time.time() * 1000)
+
+
+def get_generations(scopes):
+    """Возвращает текущие поколения областей кэша одним запросом."""
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_generation(), None)
+        generations.update(cache.get_many(missing))
+    return [generations.get(key, 0) for key in keys]
+
+
+def bump_generations(*scopes):
+    """Сбрасывает кэш страниц областей, меняя их поколение."""
+    # Страницы нового поколения строятся по основной базе,
+    # пока sync_replicas не скопирует эту запись в реплики
+    mark_written()
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_generation(), None)
+
+
+def _path_hash(request):
+    return hashlib.md5(request.get_full_path().encode()).hexdigest()
+
+
+def _page_key(request, view_name, generations):
+    # Страница общая для всех пользователей, поэтому в ключе
+    # нет пользователя: его фрагменты подставляет stitch()
+    generations = ':'.join(str(gen) for gen in generations)
+    return f'posts:page:{view_name}:{generations}:{_path_hash(request)}'
+
+
+def page_cache_key(request, view_name, scopes):
+    return _page_key(request, view_name, get_generations(scopes))
+
+
+def page_etag(request, generations):
+    """ETag страницы ленты: поколения областей, адрес и пользователь."""
+    raw = '|'.join(
+        str(part) for part in
+        (*generations, request.get_full_path(), viewer_key(request))
+    )
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def latest_page_key(request, view_name):
+    """Ключ последней построенной страницы адреса, без поколений.
+
+    Её отдают, пока страницу нового поколения строит другой запрос.
+    """
+    return f'posts:page:{view_name}:latest:{_path_hash(request)}'
+
+
+def _wait_for_entry(key):
+    """Ждёт, пока страницу построит запрос, держащий блокировку."""
+    deadline = time.monotonic() + settings.FEED_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.get(f'{key}:lock') is None:
+            return None
+    return None
+
+
+def _build(view, keys, generations, locked, request, *args, **kwargs):
+    _count('misses')
+    try:
+        # Страница из отстающей реплики попала бы в кэш
+        # под новым поколением и жила бы до следующей записи
+        with use_primary(replicas_behind()):
+            response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.cookies:
+            fresh_until = time.time() + settings.FEED_CACHE_TIMEOUT
+            cache.set_many(
+                dict.fromkeys(keys, (response, fresh_until, generations)),
+                settings.FEED_CACHE_TIMEOUT + settings.FEED_CACHE_GRACE
+            )
+    finally:
+        if locked:
+            cache.delete(f'{keys[0]}:lock')
+    return response
+
+
+def _cached_response(view, keys, generations, request, *args, **kwargs):
+    """Страница и поколения, для которых она построена."""
+    key, latest_key = keys
+    entry = cache.get(key)
+    if entry is not None:
+        response, fresh_until, _ = entry
+        if time.time() < fresh_until:
+            _count('hits')
+            return response, generations
+    # Страницу строит только запрос, получивший блокировку
+    locked = cache.add(f'{key}:lock', 1, settings.FEED_CACHE_LOCK_TIMEOUT)
+    if not locked:
+        if entry is None:
+            # После смены поколения - страница прошлого поколения
+            entry = cache.get(latest_key)
+        if entry is not None:
+            _count('stale')
+            return entry[0], entry[2]
+        _count('lock_waits')
+        entry = _wait_for_entry(key)
+        if entry is not None:
+            _count('hits')
+            return entry[0], generations
+    response = _build(
+        view, keys, generations, locked, request, *args, **kwargs
+    )
+    return response, generations
+
+
+def cache_feed(scope, kwarg=None):
+    """Кэширует страницу ленты до изменения её области.
+
+    Ключ страницы содержит поколение области (scope и значение
+    аргумента kwarg представления). Сигналы сохранения и удаления
+    постов меняют поколение, поэтому кэш сбрасывается сразу,
+    а время жизни записи может быть большим.
+
+    Устаревшую страницу перестраивает один запрос, остальные
+    в течение FEED_CACHE_GRACE получают старую копию, а после смены
+    поколения - последнюю построенную страницу того же адреса.
+    Если копии нет, они ждут построения не дольше FEED_CACHE_LOCK_WAIT.
+
+    Страница рендерится без данных пользователя (тег user_fragment
+    оставляет метки), поэтому одна запись кэша обслуживает и гостей,
+    и авторизованных пользователей.
+
+    Страница прошлого поколения уходит со своим ETag: condition()
+    не заменяет уже заданный заголовок, и клиент не получит 304
+    на устаревшую копию после её перестроения.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            scopes = [feed_scope(scope, kwargs.get(kwarg))]
+            generations = get_generations(scopes)
+            keys = (
+                _page_key(request, view.__name__, generations),
+                latest_page_key(request, view.__name__),
+            )
+            # Страницы ошибок рендерятся уже с фрагментами
+            request.page_shell = True
+            try:
+                response, built_for = _cached_response(
+                    view, keys, generations, request, *args, **kwargs
+                )
+            finally:
+                request.page_shell = False
+            if response.status_code != 200:
+                return response
+            if built_for != generations:
+                response['ETag'] = quote_etag(page_etag(request, built_for))
+            return stitch(request, response)
+        return wrapper
+    return decorator
@@ -0,0 +1,67 @@
+import hashlib
+
+from . import sharding
+from .caching import feed_scope, get_generations, page_etag
+from .fragments import viewer_key
+from .models import UserCounters, is_remote_shard
+
+
+def _digest(*parts):
+    raw = '|'.join(str(part) for part in parts)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def feed_etag(scope, kwarg=None):
+    """etag_func для condition() у ленты: без запросов к базе.
+
+    Метка составлена из поколения области кэша, адреса страницы
+    и пользователя, поэтому меняется вместе с кэшем страниц cache_feed.
+    """
+    def etag(request, *args, **kwargs):
+        return page_etag(
+            request, get_generations([feed_scope(scope, kwargs.get(kwarg))])
+        )
+    return etag
+
+
+def _post_state(request, post_id):
+    # Состояние поста нужно и для ETag, и для Last-Modified:
+    # запрос выполняется один раз на HTTP-запрос
+    cached = getattr(request, '_post_state', None)
+    if cached is None or cached[0] != post_id:
+        posts = sharding.post_queryset(post_id)
+        # Счётчики автора лежат в основной базе: к посту
+        # из удалённого шарда они читаются отдельным запросом
+        remote = is_remote_shard(posts.db)
+        state = (
+            posts.filter(pk=post_id)
+            .values_list(
+                'updated', 'comments_updated', 'comments_count',
+                'author' if remote else 'author__counters__posts_count'
+            ).first()
+        )
+        if state is not None and remote:
+            posts_count = UserCounters.objects.filter(
+                user_id=state[-1]
+            ).values_list('posts_count', flat=True).first()
+            state = (*state[:-1], posts_count)
+        cached = request._post_state = (post_id, state)
+    return cached[1]
+
+
+def post_last_modified(request, post_id):
+    """Время последнего изменения поста или его комментариев,
+    в том числе удаления комментария."""
+    state = _post_state(request, post_id)
+    if state is None:
+        return None
+    updated, comments_updated = state[:2]
+    return max(updated, comments_updated) if comments_updated else updated
+
+
+def post_etag(request, post_id):
+    """ETag страницы поста: пост, комментарии, счётчики и пользователь."""
+    state = _post_state(request, post_id)
+    if state is None:
+        return None
+    return _digest(*state, request.get_full_path(), viewer_key(request))
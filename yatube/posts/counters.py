@@ -0,0 +1,115 @@
+from collections import Counter
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import sharding
+from .models import Comment, Follow, Group, Post, UserCounters
+
+User = get_user_model()
+
+
+def change_user_counters(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя: posts_count=1 и т.п."""
+    UserCounters.objects.filter(user_id=user_id).update(**{
+        field: F(field) + delta for field, delta in deltas.items()
+    })
+
+
+def change_group_posts(group_id, delta):
+    Group.objects.filter(pk=group_id).update(
+        posts_count=F('posts_count') + delta
+    )
+
+
+def change_post_comments(post_id, delta):
+    sharding.post_queryset(post_id).filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta,
+        comments_updated=timezone.now()
+    )
+
+
+def _counts(queryset, field, ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': ids}).order_by()
+        .values_list(field).annotate(Count('pk'))
+    )
+
+
+def _post_counts(field, ids):
+    # Посты одного пользователя или группы могут лежать в разных шардах
+    counts = Counter()
+    for posts in sharding.querysets(Post):
+        counts.update(_counts(posts, field, ids))
+    return counts
+
+
+def recount_users(user_ids):
+    UserCounters.objects.bulk_create(
+        (UserCounters(user_id=pk) for pk in user_ids),
+        ignore_conflicts=True
+    )
+    posts = _post_counts('author_id', user_ids)
+    followers = _counts(Follow.objects, 'author_id', user_ids)
+    following = _counts(Follow.objects, 'user_id', user_ids)
+    UserCounters.objects.bulk_update(
+        [
+            UserCounters(
+                user_id=pk,
+                posts_count=posts.get(pk, 0),
+                followers_count=followers.get(pk, 0),
+                following_count=following.get(pk, 0),
+            )
+            for pk in user_ids
+        ],
+        ['posts_count', 'followers_count', 'following_count']
+    )
+
+
+def recount_groups(group_ids):
+    posts = _post_counts('group_id', group_ids)
+    Group.objects.bulk_update(
+        [Group(pk=pk, posts_count=posts.get(pk, 0)) for pk in group_ids],
+        ['posts_count']
+    )
+
+
+def recount_posts(post_ids, using=None):
+    """Пересчитывает комментарии постов из шарда using."""
+    comments = _counts(Comment.objects.using(using), 'post_id', post_ids)
+    # Комментарии могли быть загружены в обход сигналов
+    now = timezone.now()
+    Post.objects.using(using).bulk_update(
+        [
+            Post(
+                pk=pk, comments_count=comments.get(pk, 0),
+                comments_updated=now
+            )
+            for pk in post_ids
+        ],
+        ['comments_count', 'comments_updated']
+    )
+
+
+def batches(queryset, batch_size):
+    """Идентификаторы queryset пачками по возрастанию pk."""
+    last = 0
+    while True:
+        ids = list(
+            queryset.filter(pk__gt=last).order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def recounters():
+    """Что пересчитывать: (название, queryset, функция пересчёта)."""
+    yield 'users', User.objects.all(), recount_users
+    yield 'groups', Group.objects.all(), recount_groups
+    for posts in sharding.querysets(Post):
+        yield 'posts', posts, partial(recount_posts, using=posts._db)
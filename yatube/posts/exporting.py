@@ -0,0 +1,163 @@
+"""Потоковая выгрузка постов или комментариев в JSONL или CSV.
+
+Строки читаются пачками по ключу pk: каждая пачка - отдельный
+запрос без OFFSET, строки которого не кэшируются в QuerySet.
+Поэтому память не зависит от числа строк. Шарды выгружаются
+по очереди, внутри шарда - по возрастанию pk.
+"""
+import csv
+import json
+import zlib
+
+from django.contrib.auth import get_user_model
+
+from . import sharding
+from .models import Comment, Group, Post, is_remote_shard
+
+User = get_user_model()
+
+POSTS = 'posts'
+COMMENTS = 'comments'
+KINDS = (POSTS, COMMENTS)
+JSONL = 'jsonl'
+CSV = 'csv'
+FORMATS = (JSONL, CSV)
+CONTENT_TYPES = {JSONL: 'application/x-ndjson', CSV: 'text/csv'}
+FIELDS = (
+    'id', 'author', 'group', 'text', 'pub_date', 'updated',
+    'comments_count', 'image',
+)
+POST_FIELDS = ('text', 'pub_date', 'updated', 'comments_count', 'image')
+# Поля комментариев совпадают с полями загрузки import_posts
+COMMENT_FIELDS = ('id', 'post', 'author', 'text', 'created')
+DATE_FIELDS = ('pub_date', 'updated', 'created')
+# Сколько строк выбирать одним запросом
+BATCH_SIZE = 2000
+
+
+def _batches(queryset, columns, batch_size):
+    last = 0
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last).order_by('pk')
+            .values_list('pk', *columns)[:batch_size]
+            .iterator()
+        )
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def _usernames(rows, column):
+    return dict(
+        User.objects.filter(pk__in={row[column] for row in rows})
+        .values_list('pk', 'username')
+    )
+
+
+def _post_rows(posts, batch_size):
+    if not is_remote_shard(posts.db):
+        for rows in _batches(
+            posts, ('author__username', 'group__slug', *POST_FIELDS),
+            batch_size
+        ):
+            yield from rows
+        return
+    # В удалённом шарде нет пользователей и групп: имена
+    # для пачки читаются отдельными запросами к основной базе
+    for rows in _batches(
+        posts, ('author_id', 'group_id', *POST_FIELDS), batch_size
+    ):
+        usernames = _usernames(rows, 1)
+        slugs = dict(
+            Group.objects.filter(pk__in={row[2] for row in rows} - {None})
+            .values_list('pk', 'slug')
+        )
+        for pk, author_id, group_id, *values in rows:
+            yield (pk, usernames.get(author_id), slugs.get(group_id), *values)
+
+
+def _comment_rows(comments, batch_size):
+    if not is_remote_shard(comments.db):
+        for rows in _batches(
+            comments, ('post_id', 'author__username', 'text', 'created'),
+            batch_size
+        ):
+            yield from rows
+        return
+    for rows in _batches(
+        comments, ('post_id', 'author_id', 'text', 'created'), batch_size
+    ):
+        usernames = _usernames(rows, 2)
+        for pk, post_id, author_id, *values in rows:
+            yield (pk, post_id, usernames.get(author_id), *values)
+
+
+SOURCES = {
+    POSTS: (Post, FIELDS, _post_rows),
+    COMMENTS: (Comment, COMMENT_FIELDS, _comment_rows),
+}
+
+
+def rows(batch_size=BATCH_SIZE, kind=POSTS):
+    """Строки всех шардов: словари с полями FIELDS или COMMENT_FIELDS."""
+    model, fields, shard_rows = SOURCES[kind]
+    for queryset in sharding.querysets(model):
+        for row in shard_rows(queryset, batch_size):
+            row = dict(zip(fields, row))
+            for field in DATE_FIELDS:
+                if field in row:
+                    row[field] = row[field].isoformat()
+            yield row
+
+
+class _Line:
+    """Файл для csv.writer, который возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render(rows, format_, fields=FIELDS):
+    """Строки выгрузки в формате format_, по одной на строку rows."""
+    if format_ == CSV:
+        writer = csv.writer(_Line())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([row[field] for field in fields])
+        return
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def encode(lines, compress=False):
+    """Байты выгрузки; с compress=True - поток gzip.
+
+    Сжатые данные отдаются по мере заполнения буфера zlib,
+    без накопления всей выгрузки.
+    """
+    if not compress:
+        for line in lines:
+            yield line.encode()
+        return
+    # wbits=31 - формат gzip с заголовком и контрольной суммой
+    compressor = zlib.compressobj(wbits=31)
+    for line in lines:
+        chunk = compressor.compress(line.encode())
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def export(format_=JSONL, compress=False, batch_size=BATCH_SIZE,
+           kind=POSTS):
+    """Выгрузка всех постов или комментариев: поток байтов."""
+    fields = SOURCES[kind][1]
+    return encode(
+        render(rows(batch_size, kind), format_, fields), compress
+    )
+
+
+def filename(format_, compress=False, kind=POSTS):
+    return f'{kind}.{format_}' + ('.gz' if compress else '')
@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Sum
+
+from . import sharding
+from .models import FeedEntry, Follow, Post, UserCounters
+
+User = get_user_model()
+
+
+def is_pull_author(author_id):
+    """Автор с большим числом подписчиков: его посты не рассылаются.
+
+    Такие посты подмешиваются в ленту при чтении.
+    """
+    return UserCounters.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).exists()
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты подписчиков автора."""
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers.iterator()
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user, author):
+    """Добавляет в ленту подписчика последние посты автора."""
+    if is_pull_author(author.pk):
+        return
+    posts = author.posts.order_by('-pub_date').values_list(
+        'pk', 'pub_date'
+    )[:settings.FEED_BACKFILL_SIZE]
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user=user, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill_authors(author_ids):
+    """Добавляет последние посты авторов в ленты всех их подписчиков.
+
+    Нужна после загрузки постов и подписок в обход сигналов.
+    """
+    for author in User.objects.filter(pk__in=author_ids).iterator():
+        if is_pull_author(author.pk):
+            continue
+        posts = list(
+            author.posts.order_by('-pub_date').values_list(
+                'pk', 'pub_date'
+            )[:settings.FEED_BACKFILL_SIZE]
+        )
+        followers = Follow.objects.filter(author=author).values_list(
+            'user_id', flat=True
+        )
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for user_id in followers.iterator()
+                for pk, pub_date in posts
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True
+        )
+
+
+def _delete_entries(entries, author):
+    """Удаляет из записей entries посты автора."""
+    if not sharding.enabled():
+        entries.filter(post__author=author).delete()
+        return
+    # Посты автора лежат в его шарде, к записям лент их не присоединить
+    posts = author.posts.order_by('pk').values_list('pk', flat=True)
+    last = 0
+    while True:
+        post_ids = list(
+            posts.filter(pk__gt=last)[:settings.FEED_BATCH_SIZE]
+        )
+        if not post_ids:
+            return
+        entries.filter(post_id__in=post_ids).delete()
+        last = post_ids[-1]
+
+
+def prune(user, author):
+    """Убирает из ленты посты автора после отписки."""
+    _delete_entries(FeedEntry.objects.filter(user=user), author)
+
+
+def switch_mode(author, delta):
+    """Переключает автора между рассылкой и подмешиванием при чтении,
+    если число его подписчиков пересекло FEED_FANOUT_LIMIT.
+
+    delta - на сколько только что изменилось число подписчиков.
+    Ставший крупным автор убирается из лент, иначе его посты
+    читались бы дважды; вернувшемуся к рассылке в ленты добавляются
+    последние посты, в том числе опубликованные без рассылки.
+    """
+    followers = UserCounters.objects.filter(user=author).values_list(
+        'followers_count', flat=True
+    ).first()
+    if followers is None:
+        return
+    limit = settings.FEED_FANOUT_LIMIT
+    before = followers - delta
+    if before <= limit < followers:
+        _delete_entries(FeedEntry.objects.all(), author)
+    elif followers <= limit < before:
+        backfill_authors([author.pk])
+
+
+def pull_authors(user):
+    """Подзапрос авторов, на которых подписан user и чьи посты
+    не рассылаются по лентам."""
+    return Follow.objects.filter(
+        user=user,
+        author__counters__followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).values('author')
+
+
+def followed_feed(user):
+    """Лента подписок для паджинатора.
+
+    Ключи разосланных постов читаются из записей ленты по индексу
+    (user, pub_date), ключи постов крупных авторов - из каждого
+    шарда, с той же границей курсора; MergedFeed сливает их
+    и загружает только посты страницы.
+    """
+    entries = FeedEntry.objects.filter(user=user)
+    authors = pull_authors(user)
+    author_ids = list(authors.values_list('author', flat=True))
+
+    def count():
+        if not author_ids:
+            return entries.count()
+        pulled = UserCounters.objects.filter(
+            user__in=author_ids
+        ).aggregate(total=Sum('posts_count'))['total']
+        return entries.count() + (pulled or 0)
+
+    sources = [sharding.newest_first(entries, 'pub_date', 'post_id')]
+    if author_ids:
+        sources.extend(
+            sharding.newest_first(posts.filter(author__in=author_ids))
+            for posts in sharding.querysets(Post)
+        )
+    return sharding.MergedFeed(sources, count)
@@ -0,0 +1,93 @@
+import hashlib
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .models import Follow
+
+PLACEHOLDER = '<!--user-fragment:{}:{}-->'
+PLACEHOLDER_RE = re.compile(r'<!--user-fragment:(\w+):(.*?)-->')
+
+
+def is_anonymous(request):
+    """Запрос без сессионной cookie: пользователь точно анонимный.
+
+    Для такого запроса сессия не загружается, и ответ
+    не получает заголовок Vary: Cookie.
+    """
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def viewer_key(request):
+    """Идентификатор пользователя для ключей кэша и ETag."""
+    if is_anonymous(request) or not request.user.is_authenticated:
+        return 'anon'
+    return request.user.pk
+
+
+def _header_context(request, argument):
+    return {}
+
+
+def _follow_context(request, username):
+    following = viewer_key(request) != 'anon' and Follow.objects.filter(
+        user=request.user, author__username=username
+    ).exists()
+    return {'username': username, 'following': following}
+
+
+def _switcher_context(request, argument):
+    # Активная вкладка - по странице, в которую встроен фрагмент
+    view_name = getattr(request.resolver_match, 'view_name', '')
+    return {
+        'main_page': view_name == 'posts:main_page',
+        'follow': view_name == 'posts:follow_index',
+    }
+
+
+# Фрагменты, зависящие от пользователя: шаблон и функция контекста
+FRAGMENTS = {
+    'header': ('includes/header.html', _header_context),
+    'follow': ('includes/follow_button.html', _follow_context),
+    'switcher': ('includes/switcher.html', _switcher_context),
+}
+
+
+def render_fragment(request, name, argument=''):
+    """HTML фрагмента для пользователя запроса.
+
+    Фрагменты анонимных пользователей одинаковы для всех
+    и берутся из кэша.
+    """
+    template_name, get_context = FRAGMENTS[name]
+    if not is_anonymous(request):
+        return render_to_string(
+            template_name, get_context(request, argument), request
+        )
+    # У страниц ошибок resolver_match нет
+    view_name = getattr(request.resolver_match, 'view_name', '')
+    raw = f'{name}|{argument}|{view_name}'
+    key = f'posts:fragment:{hashlib.md5(raw.encode()).hexdigest()}'
+    html = cache.get(key)
+    if html is None:
+        context = get_context(request, argument)
+        context['user'] = AnonymousUser()
+        html = render_to_string(template_name, context, request)
+        cache.set(key, html, None)
+    return html
+
+
+def placeholder(name, argument=''):
+    return PLACEHOLDER.format(name, argument)
+
+
+def stitch(request, response):
+    """Подставляет в общую для всех страницу фрагменты пользователя."""
+    content = response.content.decode(response.charset)
+    response.content = PLACEHOLDER_RE.sub(
+        lambda match: render_fragment(request, *match.groups()), content
+    )
+    return response
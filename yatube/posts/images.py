@@ -0,0 +1,96 @@
+import hashlib
+
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from . import sharding
+from .models import IMAGE_DIR, Post, sharded_image_name
+
+EMPTY_METADATA = {
+    'image_width': None,
+    'image_height': None,
+    'image_size': None,
+    'image_format': '',
+    'image_hash': '',
+}
+METADATA_FIELDS = tuple(EMPTY_METADATA)
+SHARDED_NAME_REGEX = rf'^{IMAGE_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]+\.'
+
+
+def describe(image_file):
+    """Ширина, высота, размер в байтах, формат и SHA-256 изображения.
+
+    Возвращает словарь со значениями полей METADATA_FIELDS поста.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    image_file.seek(0)
+    for chunk in image_file.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    image_file.seek(0)
+    image = Image.open(image_file)
+    metadata = {
+        'image_width': image.width,
+        'image_height': image.height,
+        'image_size': size,
+        'image_format': image.format or '',
+        'image_hash': digest.hexdigest(),
+    }
+    image_file.seek(0)
+    return metadata
+
+
+def clear(post):
+    """Сбрасывает описание изображения поста."""
+    for field, value in EMPTY_METADATA.items():
+        setattr(post, field, value)
+
+
+def deduplicate(post):
+    """Подставляет уже сохранённый файл с тем же содержимым.
+
+    Файл ищется среди картинок постов, а затем в каталоге по хешу:
+    он мог остаться от удалённого поста. Новый файл тогда
+    не записывается, а миниатюры у одинаковых картинок общие.
+    """
+    original = next(filter(None, (
+        posts.filter(image_hash=post.image_hash)
+        .exclude(pk=post.pk).exclude(image='')
+        .values_list('image', 'image_renditions').first()
+        for posts in sharding.querysets(Post)
+    )), None)
+    if original is None:
+        name = sharded_image_name(post.image_hash, post.image.name)
+        if not (
+            default_storage.exists(name)
+            and default_storage.size(name) == post.image_size
+        ):
+            return False
+        original = (name, '')
+    post.image.name, post.image_renditions = original
+    post.image._committed = True
+    return True
+
+
+def move_to_shard(old_name, metadata):
+    """Переносит файл картинки в каталог по хешу содержимого.
+
+    Файл копируется, затем посты переключаются на копию одним UPDATE,
+    и только после этого старый файл удаляется: картинка всё время
+    доступна. Копия, оставшаяся от прерванного запуска, проверяется
+    по размеру и используется повторно. Возвращает новое имя файла.
+    """
+    new_name = sharded_image_name(metadata['image_hash'], old_name)
+    if (
+        default_storage.exists(new_name)
+        and default_storage.size(new_name) != metadata['image_size']
+    ):
+        default_storage.delete(new_name)
+    if not default_storage.exists(new_name):
+        with default_storage.open(old_name) as source:
+            new_name = default_storage.save(new_name, source)
+    for posts in sharding.querysets(Post):
+        posts.filter(image=old_name).update(image=new_name, **metadata)
+    default_storage.delete(old_name)
+    return new_name
@@ -0,0 +1,222 @@
+"""Потоковая загрузка постов, комментариев и подписок.
+
+Записи читаются из JSONL или CSV по одной и вставляются bulk_create
+пачками, каждая пачка - в своей транзакции. В памяти держатся только
+текущая пачка и таблицы имён пользователей и слагов групп.
+
+Поля записей:
+    posts - id (необязательно), author, group, text, pub_date;
+    comments - id (необязательно), post, author, text, created;
+    follows - user, author.
+Пользователи и группы указываются именем и слагом, пост - номером.
+Даты - в ISO 8601; без даты подставляется текущее время.
+При шардировании запись с id, который уже мог быть выдан
+новому посту или комментарию, пропускается.
+"""
+import csv
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import sharding
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+POSTS = 'posts'
+COMMENTS = 'comments'
+FOLLOWS = 'follows'
+KINDS = (POSTS, COMMENTS, FOLLOWS)
+JSONL = 'jsonl'
+CSV = 'csv'
+FORMATS = (JSONL, CSV)
+
+
+def read_records(stream, format_):
+    """Записи из потока: словари полей, по одной."""
+    if format_ == CSV:
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def batched(records, size):
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+@contextmanager
+def keep_dates(model):
+    """Отключает auto_now и auto_now_add у полей дат модели,
+    чтобы bulk_create сохранил даты из загружаемых записей."""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _datetime(value):
+    """Дата из записи; None, если дата указана с ошибкой."""
+    if not value:
+        return timezone.now()
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Importer:
+    """Загружает записи одного вида и считает загруженные
+    и пропущенные.
+
+    Записи с неизвестным автором, группой или постом и записи
+    с ошибочной датой пропускаются. Сигналы при вставке
+    не отправляются: счётчики, ленты и поисковый индекс
+    пересчитываются после загрузки.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.imported = 0
+        self.skipped = 0
+        # Авторы загруженных постов и подписок: их посты
+        # нужно добавить в ленты подписчиков
+        self.authors = set()
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = {}
+        if kind == POSTS:
+            self.groups = dict(Group.objects.values_list('slug', 'pk'))
+
+    def load(self, batch):
+        """Вставляет пачку записей."""
+        build, insert = {
+            POSTS: (self.build_post, self.insert_posts),
+            COMMENTS: (self.build_comment, self.insert_comments),
+            FOLLOWS: (self.build_follow, self.insert_follows),
+        }[self.kind]
+        objects = [obj for obj in map(build, batch) if obj is not None]
+        self.skipped += len(batch) - len(objects)
+        if objects:
+            insert(objects)
+
+    def build_post(self, record):
+        author_id = self.users.get(record.get('author'))
+        group_id = None
+        if record.get('group'):
+            group_id = self.groups.get(record['group'])
+            if group_id is None:
+                return None
+        pub_date = _datetime(record.get('pub_date'))
+        if author_id is None or pub_date is None:
+            return None
+        return Post(
+            pk=_int(record.get('id')), author_id=author_id,
+            group_id=group_id, text=record.get('text') or '',
+            pub_date=pub_date, updated=pub_date
+        )
+
+    def build_comment(self, record):
+        author_id = self.users.get(record.get('author'))
+        post_id = _int(record.get('post'))
+        created = _datetime(record.get('created'))
+        if author_id is None or post_id is None or created is None:
+            return None
+        return Comment(
+            pk=_int(record.get('id')), post_id=post_id, author_id=author_id,
+            text=record.get('text') or '', created=created
+        )
+
+    def build_follow(self, record):
+        user_id = self.users.get(record.get('user'))
+        author_id = self.users.get(record.get('author'))
+        if user_id is None or author_id is None or user_id == author_id:
+            return None
+        return Follow(user_id=user_id, author_id=author_id)
+
+    def _bulk_create(self, model, alias, objects):
+        if sharding.enabled():
+            claimed = sharding.claim_ids(
+                model, [obj.pk for obj in objects if obj.pk is not None]
+            )
+            kept = [
+                obj for obj in objects if obj.pk is None or obj.pk in claimed
+            ]
+            self.skipped += len(objects) - len(kept)
+            objects = kept
+            ids = iter(sharding.allocate_ids(
+                model, sum(obj.pk is None for obj in objects)
+            ))
+            for obj in objects:
+                if obj.pk is None:
+                    obj.pk = next(ids)
+        if not objects:
+            return
+        with transaction.atomic(using=alias), keep_dates(model):
+            model.objects.using(alias).bulk_create(objects)
+        self.imported += len(objects)
+
+    def insert_posts(self, posts):
+        shards = defaultdict(list)
+        for post in posts:
+            shards[sharding.shard_of_user(post.author_id)].append(post)
+            self.authors.add(post.author_id)
+        for alias, shard_posts in shards.items():
+            self._bulk_create(Post, alias, shard_posts)
+
+    def insert_comments(self, comments):
+        # Комментарий ложится в шард своего поста
+        located = {}
+        for alias in sharding.databases():
+            missing = {c.post_id for c in comments} - located.keys()
+            if not missing:
+                break
+            located.update(dict.fromkeys(
+                Post.objects.using(alias).filter(pk__in=missing)
+                .values_list('pk', flat=True),
+                alias
+            ))
+        shards = defaultdict(list)
+        for comment in comments:
+            if comment.post_id in located:
+                shards[located[comment.post_id]].append(comment)
+            else:
+                self.skipped += 1
+        for alias, shard_comments in shards.items():
+            self._bulk_create(Comment, alias, shard_comments)
+
+    def insert_follows(self, follows):
+        with transaction.atomic():
+            Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        self.imported += len(follows)
+        self.authors.update(follow.author_id for follow in follows)
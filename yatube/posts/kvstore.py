@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class LRUKVStore(KVStore):
+    """Хранилище ключей sorl-thumbnail с LRU-кэшем в памяти процесса.
+
+    Перед кэшем Django и таблицей базы стоит ограниченный словарь
+    на THUMBNAIL_LRU_SIZE записей, каждая живёт THUMBNAIL_LRU_TIMEOUT
+    секунд. Отсутствие миниатюры не запоминается ни здесь, ни в кэше
+    Django: её может создать другой процесс.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = Counter()
+
+    def get_metrics(self):
+        """Попадания и промахи LRU-кэша и число записей в нём."""
+        with self._lock:
+            return {
+                'hits': self._metrics['hits'],
+                'misses': self._metrics['misses'],
+                'size': len(self._lru),
+            }
+
+    def reset_metrics(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def clear_local(self):
+        """Очищает LRU-кэш текущего процесса."""
+        with self._lock:
+            self._lru.clear()
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._lru.move_to_end(key)
+                self._metrics['hits'] += 1
+                return entry[0]
+            if entry is not None:
+                del self._lru[key]
+            self._metrics['misses'] += 1
+            return None
+
+    def _local_set(self, key, value):
+        expires = time.monotonic() + settings.THUMBNAIL_LRU_TIMEOUT
+        with self._lock:
+            self._lru[key] = (value, expires)
+            self._lru.move_to_end(key)
+            while len(self._lru) > settings.THUMBNAIL_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _local_delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._lru.pop(key, None)
+
+    def _get_raw(self, key):
+        value = self._local_get(key)
+        if value is not None:
+            return value
+        value = self.cache.get(key)
+        if value is None or value == EMPTY_VALUE:
+            value = (
+                KVStoreModel.objects.filter(key=key)
+                .values_list('value', flat=True).first()
+            )
+            if value is None:
+                return None
+            self.cache.set(key, value, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        self._local_set(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self._local_set(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self._local_delete(keys)
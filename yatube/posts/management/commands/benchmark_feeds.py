@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts.benchmarks import (access_paths, create_indexes, drop_indexes,
+                              generate_dataset, measure)
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает планы и время запросов лент без составных индексов '
+        'и с ними на сгенерированных данных в отдельной базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database-file',
+            default=os.path.join(
+                tempfile.gettempdir(), 'yatube_benchmark.sqlite3'
+            ),
+            help='Файл базы для бенчмарка; рабочая база не затрагивается.'
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять базу и использовать уже созданные данные.'
+        )
+        parser.add_argument('--posts', type=int, default=2000000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument(
+            '--follows', type=int, default=50,
+            help='Сколько подписок у каждого пользователя.'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='Файл для отчёта в JSON.'
+        )
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict['TEST']['NAME'] = options['database_file']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb']
+        )
+        try:
+            if not Post.objects.exists():
+                self.stdout.write('Генерация данных...')
+                generate_dataset(
+                    options['posts'], options['users'], options['groups'],
+                    options['follows'], seed=options['seed']
+                )
+            report = {}
+            drop_indexes()
+            report['before'] = self.run_paths(options['repeat'])
+            create_indexes()
+            report['after'] = self.run_paths(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+        self.write_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+
+    def run_paths(self, repeat):
+        return {
+            name: measure(queryset, repeat)
+            for name, queryset in access_paths().items()
+        }
+
+    def write_report(self, report):
+        for name, before in report['before'].items():
+            after = report['after'][name]
+            self.stdout.write(
+                f'{name}: {before["median_ms"]} мс -> '
+                f'{after["median_ms"]} мс'
+            )
+            for stage, result in (('до', before), ('после', after)):
+                plan = result['plan'].replace('\n', '\n    ')
+                self.stdout.write(f'  {stage}:\n    {plan}')
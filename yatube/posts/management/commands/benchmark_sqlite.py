@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts.benchmarks import concurrent_workload, generate_dataset
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность одновременных чтений ленты '
+        'и публикаций со стандартными настройками SQLite и с рабочим '
+        'профилем (WAL, PRAGMA, постоянные соединения).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database-file',
+            default=os.path.join(
+                tempfile.gettempdir(), 'yatube_sqlite_benchmark.sqlite3'
+            ),
+            help='Файл базы для бенчмарка; рабочая база не затрагивается.'
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять базу и использовать уже созданные данные.'
+        )
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность нагрузки на каждый профиль, сек.'
+        )
+        parser.add_argument('--output', help='Файл для отчёта в JSON.')
+
+    def handle(self, *args, **options):
+        profiles = {
+            'stock': ({}, 0),
+            'production': (settings.SQLITE_PRODUCTION_PRAGMAS, 60),
+        }
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict['TEST']['NAME'] = options['database_file']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb']
+        )
+        try:
+            if not Post.objects.exists():
+                self.stdout.write('Генерация данных...')
+                generate_dataset(
+                    options['posts'], options['users'], groups=10, follows=0
+                )
+            report = {
+                name: concurrent_workload(
+                    options['readers'], options['writers'],
+                    options['duration'], pragmas, conn_max_age
+                )
+                for name, (pragmas, conn_max_age) in profiles.items()
+            }
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+        for name, result in report.items():
+            self.stdout.write(
+                f'{name}: чтений {result["reads_per_second"]}/с, '
+                f'записей {result["writes_per_second"]}/с, '
+                f'ошибок блокировки {result["locked"]}'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
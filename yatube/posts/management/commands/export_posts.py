@@ -0,0 +1,51 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.exporting import BATCH_SIZE, FORMATS, JSONL, KINDS, POSTS, export
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает все посты с авторами и группами или все комментарии '
+        'в JSONL или CSV. Память не зависит от числа строк.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='-',
+            help='Файл выгрузки; по умолчанию - stdout.'
+        )
+        parser.add_argument(
+            '--kind', choices=KINDS, default=POSTS,
+            help='Что выгружать: посты или комментарии.'
+        )
+        parser.add_argument('--format', choices=FORMATS, default=JSONL)
+        parser.add_argument(
+            '--gzip', action='store_true', help='Сжимать выгрузку gzip.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько строк выбирать одним запросом.'
+        )
+
+    def handle(self, *args, **options):
+        chunks = export(
+            options['format'], options['gzip'], options['batch_size'],
+            options['kind']
+        )
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        started = time.monotonic()
+        size = 0
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                size += len(chunk)
+        self.stdout.write(
+            f'Записано {size} байт за {time.monotonic() - started:.1f} с'
+        )
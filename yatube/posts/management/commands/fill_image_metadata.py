@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from posts import sharding
+from posts.counters import batches
+from posts.images import METADATA_FIELDS, describe
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполняет размеры, формат и хеш картинок старых постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов обновлять одним запросом.'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for posts in sharding.querysets(Post):
+            queryset = posts.exclude(image='').filter(image_hash='')
+            for ids in batches(queryset, options['batch_size']):
+                described = []
+                for post in posts.filter(pk__in=ids).only('image'):
+                    try:
+                        with post.image.open('rb'):
+                            metadata = describe(post.image)
+                    except OSError as error:
+                        self.stderr.write(f'{post.image.name}: {error}')
+                        continue
+                    for field, value in metadata.items():
+                        setattr(post, field, value)
+                    described.append(post)
+                posts.bulk_update(described, METADATA_FIELDS)
+                total += len(described)
+        self.stdout.write(f'Описано картинок: {total}')
@@ -0,0 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import sharding
+from posts.models import Post
+from posts.thumbnails import generate, init_worker
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры изображений всех постов в пуле процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+            help='Сколько процессов генерации запустить.'
+        )
+
+    def handle(self, *args, **options):
+        # Одна картинка может быть у постов из разных шардов
+        image_names = sorted({
+            name
+            for posts in sharding.querysets(Post)
+            for name in posts.exclude(image='')
+            .order_by().values_list('image', flat=True).distinct()
+        })
+        workers = options['workers']
+        if workers < 1:
+            done = [generate(name) for name in image_names]
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=init_worker
+            ) as executor:
+                done = list(executor.map(generate, image_names, chunksize=8))
+        self.stdout.write(f'Обработано изображений: {len(done)}')
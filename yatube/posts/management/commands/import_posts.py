@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.feed import backfill_authors
+from posts.importing import (CSV, FORMATS, KINDS, POSTS, Importer, batched,
+                             read_records)
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает посты, комментарии или подписки из JSONL или CSV '
+        'пачками bulk_create. Поля записей описаны в posts/importing.py.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с записями; - читать stdin.')
+        parser.add_argument('--kind', choices=KINDS, default=POSTS)
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат записей; по умолчанию - по расширению файла.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько записей вставлять в одной транзакции.'
+        )
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересчитывать счётчики, ленты и поисковый индекс.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format_ = options['format'] or (
+            CSV if path.lower().endswith('.csv') else FORMATS[0]
+        )
+        if path != '-' and not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        importer = Importer(options['kind'])
+        stream = sys.stdin if path == '-' else open(
+            path, encoding='utf-8', newline=''
+        )
+        started = time.monotonic()
+        try:
+            records = read_records(stream, format_)
+            for batch in batched(records, options['batch_size']):
+                importer.load(batch)
+                self.report(importer, started)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        if options['no_rebuild']:
+            return
+        self.stdout.write('Пересчёт счётчиков, лент и поискового индекса...')
+        call_command('recount_counters', stdout=self.stdout)
+        if options['kind'] == POSTS:
+            call_command('rebuild_search_index', stdout=self.stdout)
+        for author_ids in batched(sorted(importer.authors),
+                                  options['batch_size']):
+            backfill_authors(author_ids)
+        # Закэшированные страницы и числа постов устарели
+        cache.clear()
+
+    def report(self, importer, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        rows = importer.imported + importer.skipped
+        self.stdout.write(
+            f'{importer.kind}: загружено {importer.imported}, '
+            f'пропущено {importer.skipped}, '
+            f'{rows / elapsed:.0f} записей/с'
+        )
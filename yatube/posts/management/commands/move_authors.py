@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import sharding
+from posts.counters import batches
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты авторов с комментариями в другой шард. '
+        'Без --to авторы распределяются по шардам равномерно. '
+        'Прерванный перенос продолжается повторным запуском.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--author', action='append', default=[],
+            help='Имя автора; можно указать несколько раз. '
+                 'По умолчанию - все авторы.'
+        )
+        parser.add_argument('--to', help='Шард из POST_SHARDS.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов копировать за один запрос.'
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError(
+                'Шардирование не настроено: задайте YATUBE_POST_SHARDS'
+            )
+        target = options['to']
+        if target is not None and target not in sharding.databases():
+            raise CommandError(
+                f'Неизвестный шард {target}; доступны: '
+                + ', '.join(sharding.databases())
+            )
+        users = User.objects.all()
+        if options['author']:
+            users = users.filter(username__in=options['author'])
+        for ids in batches(users, options['batch_size']):
+            for user_id in ids:
+                moved = sharding.move_author(
+                    user_id, target or sharding.placement(user_id),
+                    options['batch_size']
+                )
+                if moved:
+                    self.stdout.write(
+                        f'{user_id}: перенесено постов {moved}'
+                    )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search, sharding
+from posts.counters import batches
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько постов индексировать в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        search.backend.clear()
+        total = 0
+        for posts in sharding.querysets(Post):
+            for ids in batches(posts, options['batch_size']):
+                with transaction.atomic():
+                    for post in posts.filter(pk__in=ids).only('text'):
+                        search.index_post(post)
+                total += len(ids)
+        self.stdout.write(f'Проиндексировано постов: {total}')
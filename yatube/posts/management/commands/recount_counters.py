@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import batches, recounters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько объектов пересчитывать в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for name, queryset, recount in recounters():
+            total = 0
+            for ids in batches(queryset, batch_size):
+                with transaction.atomic():
+                    recount(ids)
+                total += len(ids)
+            self.stdout.write(f'{name}: пересчитано {total}')
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+
+from posts import sharding
+from posts.caching import bump_generations
+from posts.counters import batches
+from posts.images import (
+    METADATA_FIELDS, SHARDED_NAME_REGEX, describe, move_to_shard
+)
+from posts.models import Post
+from posts.thumbnails import post_scopes
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов в каталоги posts/ab/cd/ по хешу. '
+        'Прерванный перенос продолжается повторным запуском.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов переносить за один проход.'
+        )
+
+    def metadata(self, post):
+        if post.image_hash:
+            return {field: getattr(post, field) for field in METADATA_FIELDS}
+        with post.image.open('rb'):
+            return describe(post.image)
+
+    def handle(self, *args, **options):
+        moved = 0
+        for posts in sharding.querysets(Post):
+            queryset = posts.exclude(image='').exclude(
+                image__regex=SHARDED_NAME_REGEX
+            )
+            for ids in batches(queryset, options['batch_size']):
+                # Авторы и группы лежат в основной базе, из шарда
+                # их не присоединить
+                batch = posts.filter(pk__in=ids).prefetch_related(
+                    'author', 'group'
+                )
+                names = {}
+                scopes = set()
+                for post in batch:
+                    old_name = post.image.name
+                    if old_name not in names:
+                        try:
+                            names[old_name] = move_to_shard(
+                                old_name, self.metadata(post)
+                            )
+                        except OSError as error:
+                            self.stderr.write(f'{old_name}: {error}')
+                            continue
+                        moved += 1
+                    scopes.update(post_scopes(post))
+                # Закэшированные страницы ссылаются на старые имена
+                # файлов
+                bump_generations(*scopes)
+        self.stdout.write(f'Перенесено файлов: {moved}')
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_renditions',
+            field=models.TextField(blank=True, editable=False, help_text='Ширины, размеры и файлы миниатюр по форматам, JSON', verbose_name='Миниатюры картинки'),
+        ),
+    ]
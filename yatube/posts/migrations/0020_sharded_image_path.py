@@ -0,0 +1,19 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:02
+
+from django.db import migrations, models
+import posts.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_post_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, upload_to=posts.models.post_image_path, verbose_name='Картинка'),
+        ),
+    ]
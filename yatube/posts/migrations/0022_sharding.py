@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0021_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorShard',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('shard', models.CharField(max_length=50, verbose_name='Шард')),
+                ('moving_to', models.CharField(blank=True, max_length=50, verbose_name='Переносится в шард')),
+                ('moved_from', models.CharField(blank=True, max_length=50, verbose_name='Перенесён из шарда')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Модель')),
+                ('value', models.BigIntegerField(verbose_name='Следующий идентификатор')),
+            ],
+        ),
+    ]
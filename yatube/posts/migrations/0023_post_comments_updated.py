@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:51
+
+from django.db import migrations, models
+
+
+def fill_comments_updated(apps, schema_editor):
+    """Берёт дату изменения комментариев из последнего комментария."""
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    alias = schema_editor.connection.alias
+    last_comment = Comment.objects.using(alias).filter(
+        post=models.OuterRef('pk')
+    ).order_by('-created').values('created')[:1]
+    Post.objects.using(alias).filter(comments_count__gt=0).update(
+        comments_updated=models.Subquery(last_comment)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_sharding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_updated',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Дата изменения комментариев'),
+        ),
+        migrations.RunPython(fill_comments_updated, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,30 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models
 
 User = get_user_model()
 
+IMAGE_DIR = 'posts'
+
+
+def sharded_image_name(digest, filename):
+    """Путь картинки вида posts/ab/cd/<хеш>.<расширение>.
+
+    Файлы распределяются по 65536 каталогам, поэтому ни в одном
+    каталоге не набирается миллионов записей.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    return f'{IMAGE_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def post_image_path(instance, filename):
+    """upload_to картинки поста: каталог по хешу содержимого."""
+    digest = instance.image_hash or uuid.uuid4().hex
+    return sharded_image_name(digest, filename)
+
 
 class CreatedModel(models.Model):
     """Абстрактная модель. Добавляет дату создания."""
@@ -16,16 +38,100 @@ class CreatedModel(models.Model):
         abstract = True
 
 
-class Group(models.Model):
+class CountersModel(models.Model):
+    """Абстрактная модель со счётчиками.
+
+    Обычное сохранение не записывает поля counter_fields:
+    они меняются только атомарными UPDATE с F(), и устаревшее
+    значение в экземпляре не должно их перезаписать.
+    """
+    counter_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            skipped = set(self.counter_fields) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+                and field.name not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+
+class Group(CountersModel):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(
+        'Число постов',
+        default=0
+    )
+
+    counter_fields = ('posts_count',)
 
     def __str__(self):
         return self.title
 
 
-class Post(models.Model):
+def is_remote_shard(alias):
+    """Шард, кроме основной базы: пользователей и групп в нём нет."""
+    return alias != DEFAULT_DB_ALIAS and alias in settings.POST_SHARDS
+
+
+def with_related(queryset, *lookups):
+    """select_related, а в удалённом шарде - prefetch_related:
+    связанные пользователи и группы читаются из основной базы."""
+    if is_remote_shard(queryset.db):
+        return queryset.prefetch_related(*lookups)
+    return queryset.select_related(*lookups)
+
+
+class PostQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        """Создаёт пост через save(), чтобы роутер выбрал базу
+        по самому посту, то есть по шарду автора.
+
+        Явно указанная через using() база сохраняется.
+        """
+        if self._db is not None:
+            return super().create(**kwargs)
+        post = self.model(**kwargs)
+        post.save(force_insert=True)
+        return post
+
+    def for_feed(self):
+        """Посты для лент: автор и группа подгружаются одним запросом.
+
+        Из связанных таблиц выбираются только поля, нужные шаблонам.
+        В удалённом шарде автор и группа подгружаются отдельными
+        запросами к основной базе.
+        """
+        if is_remote_shard(self.db):
+            return self.only(
+                'text', 'pub_date', 'updated', 'image', 'image_renditions',
+                'author', 'group',
+            ).prefetch_related(
+                models.Prefetch('author', User.objects.only(
+                    'username', 'first_name', 'last_name'
+                )),
+                models.Prefetch('group', Group.objects.only('slug', 'title')),
+            )
+        return self.select_related('author', 'group').only(
+            'text', 'pub_date', 'updated', 'image', 'image_renditions',
+            'author', 'group',
+            'author__username', 'author__first_name', 'author__last_name',
+            'group__slug', 'group__title',
+        )
+
+
+class Post(CountersModel):
     text = models.TextField(
         'Текст поста',
         help_text='Введите текст поста'
@@ -35,6 +141,10 @@ class Post(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
     group = models.ForeignKey(
         Group,
         blank=True,
@@ -52,12 +162,73 @@ class Post(models.Model):
     )
     image = models.ImageField(
         'Картинка',
-        upload_to='posts/',
+        upload_to=post_image_path,
         blank=True
     )
+    image_renditions = models.TextField(
+        'Миниатюры картинки',
+        blank=True,
+        editable=False,
+        help_text='Ширины, размеры и файлы миниатюр по форматам, JSON'
+    )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        editable=False
+    )
+    image_size = models.PositiveIntegerField(
+        'Размер файла картинки',
+        null=True,
+        editable=False
+    )
+    image_format = models.CharField(
+        'Формат картинки',
+        max_length=10,
+        blank=True,
+        editable=False
+    )
+    image_hash = models.CharField(
+        'SHA-256 картинки',
+        max_length=64,
+        blank=True,
+        db_index=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0
+    )
+    # Нужна для Last-Modified: удаление комментария не оставляет
+    # следа в датах самих комментариев
+    comments_updated = models.DateTimeField(
+        'Дата изменения комментариев',
+        null=True,
+        blank=True,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    counter_fields = ('comments_count', 'comments_updated')
 
     class Meta:
         ordering = ['-pub_date']
+        # Ленты группы и автора читаются по индексу уже в нужном порядке
+        indexes = [
+            models.Index(
+                fields=['group', '-pub_date'],
+                name='post_group_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='post_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text
@@ -86,6 +257,14 @@ class Comment(CreatedModel):
         auto_now_add=True
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -103,6 +282,14 @@ class Follow(models.Model):
     )
 
     class Meta:
+        # Индекс (user, author) даёт ограничение unique_followers,
+        # обратный нужен для выборки подписчиков автора
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],
@@ -113,3 +300,109 @@ class Follow(models.Model):
                 name='not_sub'
             )
         ]
+
+
+class UserCounters(models.Model):
+    """Счётчики пользователя, обновляемые при создании и удалении
+    постов и подписок."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters'
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        'Число подписок',
+        default=0
+    )
+
+    def __str__(self):
+        return f'Счётчики {self.user}'
+
+
+class FeedEntry(models.Model):
+    """Запись ленты подписок: пост автора, на которого подписан user."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date']
+        indexes = [
+            # post - второй ключ курсора ленты, сортировка по нему
+            # тоже идёт по индексу
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_post_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_entry'
+            ),
+        ]
+
+
+class SearchPosting(models.Model):
+    """Запись инвертированного индекса: основа слова и пост с ней.
+
+    Используется поиском, если SQLite собран без FTS5.
+    """
+    term = models.CharField('Основа слова', max_length=100)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_postings'
+    )
+    frequency = models.PositiveIntegerField('Число вхождений')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'post'], name='search_term_post_idx'),
+        ]
+
+
+class AuthorShard(models.Model):
+    """Карта шардов: база, в которой лежат посты автора
+    и комментарии к ним.
+
+    Авторы без записи живут в первом шарде. Поля moving_to
+    и moved_from хранят состояние незавершённого переноса.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='shard'
+    )
+    shard = models.CharField('Шард', max_length=50)
+    moving_to = models.CharField('Переносится в шард', max_length=50,
+                                 blank=True)
+    moved_from = models.CharField('Перенесён из шарда', max_length=50,
+                                  blank=True)
+
+    def __str__(self):
+        return f'{self.user}: {self.shard}'
+
+
+class IdSequence(models.Model):
+    """Следующий свободный идентификатор модели, общий для шардов."""
+    name = models.CharField('Модель', max_length=100, primary_key=True)
+    value = models.BigIntegerField('Следующий идентификатор')
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
@@ -1,9 +1,312 @@
+import base64
+import binascii
+import json
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .models import with_related
+
+NEXT = 'n'
+PREVIOUS = 'p'
+# На сколько страниц вперёд от текущей точно считаются посты
+COUNT_PAGES_AHEAD = 5
+# Окно номеров страниц: соседей с каждой стороны и страниц по краям
+PAGES_ON_EACH_SIDE = 2
+PAGES_ON_ENDS = 1
+
+
+def count_cache_key(group=None, author=None):
+    """Ключ кэша с числом постов ленты: всей, группы или автора."""
+    if group is not None:
+        return f'posts:count:group:{group}'
+    if author is not None:
+        return f'posts:count:author:{author}'
+    return 'posts:count:all'
+
+
+class CachedCountMixin:
+    """Считает объекты паджинатора через кэш.
+
+    Точное число берётся из кэша по count_key, который поддерживают
+    сигналы создания и удаления постов. Если в кэше числа нет,
+    считается не больше count_limit строк: при превышении предела
+    число помечается как приблизительное и в кэш не попадает.
+
+    Известное заранее число (например, из счётчиков группы или
+    автора) передаётся в known_count и используется без запросов.
+    """
+    count_key = None
+    count_limit = None
+    known_count = None
+    count_is_exact = True
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        if self.count_key is not None:
+            count = cache.get(self.count_key)
+            if count is not None:
+                return count
+        if self.count_limit is not None and hasattr(self.object_list, 'query'):
+            count = self.object_list[:self.count_limit + 1].count()
+            if count > self.count_limit:
+                self.count_is_exact = False
+                return count
+        else:
+            count = super().count
+        if self.count_key is not None:
+            cache.set(self.count_key, count, settings.POST_COUNT_TIMEOUT)
+        return count
+
+
+class CountedPage(Page):
+    @property
+    def elided_page_range(self):
+        return self.paginator.get_elided_page_range(self.number)
+
+
+class CountedPaginator(CachedCountMixin, Paginator):
+    """Паджинатор по номерам страниц с кэшированным числом постов."""
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, count_key=None,
+                 count_limit=None, known_count=None):
+        super().__init__(object_list, per_page)
+        self.count_key = count_key
+        self.count_limit = count_limit
+        self.known_count = known_count
+
+    def _get_page(self, *args, **kwargs):
+        return CountedPage(*args, **kwargs)
+
+    def get_elided_page_range(self, number=1, on_each_side=PAGES_ON_EACH_SIDE,
+                              on_ends=PAGES_ON_ENDS):
+        """Номера страниц вокруг текущей и по краям, пропуски - ELLIPSIS.
+
+        Длина списка не зависит от числа страниц. Если число постов
+        приблизительное, последние страницы не показываются.
+        """
+        number = self.validate_number(number)
+        last = self.num_pages
+        pages = []
+        if number > 1 + on_each_side + on_ends + 1:
+            pages.extend(range(1, on_ends + 1))
+            pages.append(self.ELLIPSIS)
+            pages.extend(range(number - on_each_side, number + 1))
+        else:
+            pages.extend(range(1, number + 1))
+        if not self.count_is_exact:
+            tail = min(number + on_each_side, last)
+            pages.extend(range(number + 1, tail + 1))
+        elif number < last - on_each_side - on_ends - 1:
+            pages.extend(range(number + 1, number + on_each_side + 1))
+            pages.append(self.ELLIPSIS)
+            pages.extend(range(last - on_ends + 1, last + 1))
+        else:
+            pages.extend(range(number + 1, last + 1))
+        return pages
+
+
+class CursorPage(Page):
+    """Страница курсорного паджинатора.
+
+    Номер страницы и общее число страниц не известны,
+    вместо них страница отдаёт курсоры соседних страниц.
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Cursor page>'
 
+    def has_next(self):
+        return self._has_next
 
-def get_paginator(queryset, request):
-    paginator = Paginator(queryset, settings.SHOW_POSTS)
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.encode_cursor(NEXT, self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.encode_cursor(PREVIOUS, self.object_list[0])
+
+
+class CursorPaginator(CachedCountMixin, Paginator):
+    """Паджинатор по ключу сортировки, по умолчанию (pub_date, id).
+
+    Не выполняет COUNT(*) и OFFSET: каждая страница выбирается
+    условием «строго после последнего показанного поста»,
+    поэтому глубина страницы не влияет на время запроса.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-pk'),
+                 count_key=None, count_limit=None, known_count=None):
+        super().__init__(object_list, per_page)
+        self.ordering = ordering
+        self.count_key = count_key
+        self.count_limit = count_limit
+        self.known_count = known_count
+
+    @cached_property
+    def _keys(self):
+        return [
+            (name.lstrip('-'), name.startswith('-'))
+            for name in self.ordering
+        ]
+
+    def _to_python(self, name, value):
+        model = self.object_list.model
+        if name == 'pk':
+            field = model._meta.pk
+        else:
+            field = model._meta.get_field(name)
+        return field.to_python(value)
+
+    def encode_cursor(self, direction, obj):
+        values = []
+        for name, _ in self._keys:
+            value = getattr(obj, name)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(str(value))
+        raw = json.dumps([direction, values]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (направление, значения ключа) или None."""
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(raw.decode())
+            if direction not in (NEXT, PREVIOUS):
+                return None
+            if len(values) != len(self._keys):
+                return None
+            values = [
+                self._to_python(name, value)
+                for (name, _), value in zip(self._keys, values)
+            ]
+        except (
+            binascii.Error, UnicodeDecodeError, TypeError, ValueError,
+            ValidationError
+        ):
+            return None
+        if None in values:
+            return None
+        return direction, values
+
+    def _after(self, values, reverse=False):
+        """Условие «после курсора» в порядке сортировки паджинатора."""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self._keys, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _reversed_ordering(self):
+        return [
+            name.lstrip('-') if name.startswith('-') else f'-{name}'
+            for name in self.ordering
+        ]
+
+    def _fetch(self, values=None, reverse=False):
+        """Первые per_page + 1 объектов после курсора values.
+
+        Лента из нескольких источников выбирает их сама методом
+        keyset, остальные - запросом с условием _after.
+        """
+        limit = self.per_page + 1
+        if hasattr(self.object_list, 'keyset'):
+            return self.object_list.keyset(limit, values, reverse)
+        ordering = self._reversed_ordering() if reverse else self.ordering
+        queryset = self.object_list.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+        return list(queryset[:limit])
+
+    def get_page(self, cursor):
+        """Возвращает страницу по курсору.
+
+        Неверный или пустой курсор даёт первую страницу.
+        """
+        decoded = self.decode_cursor(cursor)
+        if decoded is None:
+            items = self._fetch()
+            has_next = len(items) > self.per_page
+            return CursorPage(items[:self.per_page], self, has_next, False)
+        direction, values = decoded
+        if direction == NEXT:
+            items = self._fetch(values)
+            has_next = len(items) > self.per_page
+            return CursorPage(items[:self.per_page], self, has_next, True)
+        items = self._fetch(values, reverse=True)
+        has_previous = len(items) > self.per_page
+        items = items[:self.per_page][::-1]
+        return CursorPage(items, self, True, has_previous)
+
+
+def _count_limit(page_number):
+    """Сколько постов посчитать, чтобы текущая страница была точной."""
+    try:
+        page_number = max(int(page_number), 1)
+    except (TypeError, ValueError):
+        page_number = 1
+    return max(
+        settings.POST_COUNT_LIMIT,
+        (page_number + COUNT_PAGES_AHEAD) * settings.SHOW_POSTS
+    )
+
+
+def get_paginator(queryset, request, count_key=None, count=None):
+    # Курсор работает с QuerySet и лентами MergedFeed,
+    # списки листаются по номерам
+    if (hasattr(queryset, 'query') or hasattr(queryset, 'keyset')) and (
+        settings.PAGINATION_MODE == 'cursor'
+        or 'cursor' in request.GET
+    ):
+        paginator = CursorPaginator(
+            queryset, settings.SHOW_POSTS,
+            count_key=count_key,
+            count_limit=settings.POST_COUNT_LIMIT,
+            known_count=count
+        )
+        return paginator.get_page(request.GET.get('cursor'))
     page_number = request.GET.get('page')
+    paginator = CountedPaginator(
+        queryset, settings.SHOW_POSTS,
+        count_key=count_key,
+        count_limit=_count_limit(page_number),
+        known_count=count
+    )
     page_obj = paginator.get_page(page_number)
     return page_obj
+
+
+def get_comments_page(post, request):
+    """Страница комментариев поста по курсору, от старых к новым."""
+    paginator = CursorPaginator(
+        with_related(post.comments.order_by('created', 'pk'), 'author'),
+        settings.SHOW_COMMENTS,
+        ordering=('created', 'pk')
+    )
+    return paginator.get_page(request.GET.get('cursor'))
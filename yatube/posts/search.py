@@ -0,0 +1,218 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+from django.utils.functional import SimpleLazyObject
+
+from . import sharding
+from .models import Post, SearchPosting
+from .stemmer import stem
+
+FTS_TABLE = 'posts_post_fts'
+AND = 'and'
+OR = 'or'
+
+WORD_RE = re.compile(r'[0-9a-zа-яё]+')
+STOP_WORDS = frozenset((
+    'а', 'без', 'бы', 'в', 'во', 'вот', 'все', 'да', 'для', 'до', 'его',
+    'ее', 'если', 'есть', 'же', 'за', 'и', 'из', 'или', 'им', 'их', 'к',
+    'как', 'ли', 'на', 'над', 'не', 'нет', 'ни', 'но', 'о', 'об', 'он',
+    'она', 'они', 'от', 'по', 'под', 'при', 'с', 'со', 'так', 'то',
+    'у', 'уже', 'что', 'это', 'я',
+    'a', 'an', 'and', 'in', 'is', 'of', 'on', 'or', 'the', 'to',
+))
+
+
+def tokenize(text):
+    """Основы значимых слов текста в порядке появления."""
+    return [
+        stem(word) for word in WORD_RE.findall(text.lower())
+        if word not in STOP_WORDS
+    ]
+
+
+class Fts5Backend:
+    """Индекс в виртуальной таблице SQLite FTS5.
+
+    В таблицу пишутся уже выделенные основы слов, поэтому
+    поиск учитывает русскую морфологию, а ранжирует BM25.
+    """
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, terms) VALUES (%s, %s)',
+                [post.pk, ' '.join(tokenize(post.text))]
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def _match(self, terms, mode):
+        operator = ' AND ' if mode == AND else ' OR '
+        return operator.join(f'"{term}"' for term in terms)
+
+    def search(self, terms, mode, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY rank, rowid DESC LIMIT %s',
+                [self._match(terms, mode), limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, posts, terms, mode):
+        # RawSQL в pk__in получил бы вторые скобки, и SQLite
+        # сравнивал бы pk только с первой строкой подзапроса
+        return posts.extra(
+            where=[
+                f'{Post._meta.db_table}.id IN (SELECT rowid FROM '
+                f'{FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)'
+            ],
+            params=[self._match(terms, mode)]
+        )
+
+
+class PostingsBackend:
+    """Инвертированный индекс в таблице SearchPosting.
+
+    Списки постов по основам выбираются из базы,
+    пересечение или объединение и ранжирование TF-IDF
+    выполняются в Python.
+    """
+
+    def index(self, post):
+        SearchPosting.objects.filter(post_id=post.pk).delete()
+        SearchPosting.objects.bulk_create(
+            SearchPosting(post_id=post.pk, term=term[:100], frequency=count)
+            for term, count in Counter(tokenize(post.text)).items()
+        )
+
+    def remove(self, post_id):
+        SearchPosting.objects.filter(post_id=post_id).delete()
+
+    def clear(self):
+        SearchPosting.objects.all().delete()
+
+    def search(self, terms, mode, limit):
+        postings = defaultdict(dict)
+        rows = SearchPosting.objects.filter(term__in=terms).values_list(
+            'term', 'post_id', 'frequency'
+        )
+        for term, post_id, frequency in rows.iterator():
+            postings[term][post_id] = frequency
+        if mode == AND and len(postings) < len(set(terms)):
+            return []
+        total = max(
+            sum(posts.count() for posts in sharding.querysets(Post)), 1
+        )
+        scores = Counter()
+        matched = Counter()
+        for term, posts in postings.items():
+            idf = math.log(1 + total / len(posts))
+            for post_id, frequency in posts.items():
+                scores[post_id] += (1 + math.log(frequency)) * idf
+                matched[post_id] += 1
+        if mode == AND:
+            scores = {
+                post_id: score for post_id, score in scores.items()
+                if matched[post_id] == len(postings)
+            }
+        ranked = sorted(
+            scores, key=lambda post_id: (-scores[post_id], -post_id)
+        )
+        return ranked[:limit]
+
+    def filter(self, posts, terms, mode):
+        postings = SearchPosting.objects.filter(term__in=terms)
+        if mode == AND:
+            postings = postings.values('post_id').annotate(
+                matched=Count('term', distinct=True)
+            ).filter(matched=len(set(terms)))
+        return posts.filter(pk__in=postings.values('post_id'))
+
+
+def _fts5_available():
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def _get_backend():
+    if _fts5_available():
+        return Fts5Backend()
+    return PostingsBackend()
+
+
+backend = SimpleLazyObject(_get_backend)
+
+
+def index_post(post):
+    backend.index(post)
+
+
+def remove_post(post_id):
+    backend.remove(post_id)
+
+
+def search(query, mode=AND, limit=None):
+    """Идентификаторы постов по запросу, от более релевантных."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+    if limit is None:
+        limit = settings.SEARCH_MAX_RESULTS
+    return backend.search(terms, mode, limit)
+
+
+def filter_posts(queryset, query, mode=AND):
+    """Посты queryset, подходящие под запрос, без ранжирования.
+
+    Совпадения выбираются подзапросом к индексу, без ограничения
+    SEARCH_MAX_RESULTS: порядок и страницы задаёт сам queryset,
+    например список постов в админке.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return queryset.none()
+    return backend.filter(queryset, terms, mode)
+
+
+class SearchResults:
+    """Результаты поиска для паджинатора.
+
+    Посты загружаются только для запрошенного среза идентификаторов.
+    """
+
+    def __init__(self, post_ids):
+        self.post_ids = post_ids
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def __getitem__(self, index):
+        post_ids = self.post_ids[index]
+        if not isinstance(index, slice):
+            return sharding.post_queryset(post_ids).for_feed().get(
+                pk=post_ids
+            )
+        posts = sharding.in_bulk(post_ids, lambda posts: posts.for_feed())
+        return [posts[pk] for pk in post_ids if pk in posts]
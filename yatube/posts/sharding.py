@@ -0,0 +1,463 @@
+"""Шардирование постов и комментариев по авторам.
+
+Посты автора и комментарии к ним лежат в одной базе из POST_SHARDS,
+какой - записано в карте AuthorShard. Пользователи, группы, подписки,
+ленты и поисковый индекс остаются в основной базе. Идентификаторы
+постов и комментариев выдаются общими для всех шардов, поэтому
+пост сохраняет свой адрес при переносе автора в другой шард.
+"""
+import heapq
+import threading
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import (DEFAULT_DB_ALIAS, DatabaseError, IntegrityError,
+                       connections, transaction)
+from django.db.models import F, Max, Q
+
+from .models import AuthorShard, Comment, IdSequence, Post
+
+User = get_user_model()
+
+SHARDED_MODELS = (Post, Comment)
+# Сколько хранить в кэше шард автора и поста, сек.
+LOCATION_TIMEOUT = 60 * 60 * 24
+
+_id_blocks = {}
+_id_lock = threading.Lock()
+
+
+def enabled():
+    return bool(settings.POST_SHARDS)
+
+
+def databases():
+    """Базы, в которых лежат посты."""
+    return settings.POST_SHARDS or [DEFAULT_DB_ALIAS]
+
+
+def querysets(model):
+    """Менеджеры модели во всех шардах.
+
+    Без шардирования - один менеджер, базу которому выбирают роутеры.
+    """
+    if not enabled():
+        return [model.objects.all()]
+    return [model.objects.using(alias) for alias in databases()]
+
+
+def placement(user_id):
+    """Шард автора при равномерном распределении по шардам."""
+    shards = databases()
+    return shards[user_id % len(shards)]
+
+
+def _user_key(user_id):
+    return f'posts:shard:user:{user_id}'
+
+
+def _post_key(post_id):
+    return f'posts:shard:post:{post_id}'
+
+
+def shard_of_user(user_id):
+    """Шард с постами автора."""
+    if not enabled():
+        return DEFAULT_DB_ALIAS
+    alias = cache.get(_user_key(user_id))
+    if alias is None:
+        alias = AuthorShard.objects.using(DEFAULT_DB_ALIAS).filter(
+            user_id=user_id
+        ).values_list('shard', flat=True).first() or databases()[0]
+        cache.set(_user_key(user_id), alias, LOCATION_TIMEOUT)
+    return alias
+
+
+def shard_of_post(post_id):
+    """Шард с постом; несуществующий пост ищется в первом шарде.
+
+    Во время переноса автора пост лежит в двух шардах: верным
+    считается шард автора из карты шардов.
+    """
+    if not enabled() or post_id is None:
+        return DEFAULT_DB_ALIAS
+    alias = cache.get(_post_key(post_id))
+    if alias is not None:
+        return alias
+    for found in databases():
+        author_id = Post.objects.using(found).filter(
+            pk=post_id
+        ).values_list('author_id', flat=True).first()
+        if author_id is not None:
+            break
+    else:
+        return databases()[0]
+    alias = shard_of_user(author_id)
+    if alias != found and not Post.objects.using(alias).filter(
+        pk=post_id
+    ).exists():
+        # Пост ещё не скопирован в шард автора: место не кэшируется
+        return found
+    cache.set(_post_key(post_id), alias, LOCATION_TIMEOUT)
+    return alias
+
+
+def post_queryset(post_id):
+    """Менеджер постов в шарде поста post_id."""
+    if not enabled():
+        return Post.objects.all()
+    return Post.objects.using(shard_of_post(post_id))
+
+
+def in_bulk(post_ids, prepare=None):
+    """Посты по идентификаторам из всех шардов: {pk: пост}.
+
+    prepare дополняет запрос к каждому шарду, например for_feed.
+    """
+    found = {}
+    for posts in querysets(Post):
+        missing = [pk for pk in post_ids if pk not in found]
+        if not missing:
+            break
+        if prepare is not None:
+            posts = prepare(posts)
+        found.update(posts.in_bulk(missing))
+    return found
+
+
+class ShardRouter:
+    """Посты и комментарии - в шард автора поста.
+
+    Запросы без подсказки instance и остальные модели
+    маршрутизируют следующие роутеры. Post.objects.create()
+    сохраняет пост через save() с подсказкой instance, поэтому
+    тоже пишет в шард автора; Comment.objects.create() пишет
+    в основную базу, комментарии создаются через save()
+    или post.comments.create().
+    """
+
+    def _db_for(self, model, instance):
+        if not enabled() or model not in SHARDED_MODELS or instance is None:
+            return None
+        if isinstance(instance, SHARDED_MODELS) and not instance._state.adding:
+            return instance._state.db
+        # Новой строке база могла достаться при присваивании автора,
+        # шард определяется заново
+        if isinstance(instance, Post):
+            return shard_of_user(instance.author_id)
+        if isinstance(instance, Comment):
+            post = instance._state.fields_cache.get('post')
+            if post is not None and post._state.db:
+                return post._state.db
+            return shard_of_post(instance.post_id)
+        if model is Post and isinstance(instance, User):
+            return shard_of_user(instance.pk)
+        if model is Post and hasattr(instance, 'post_id'):
+            # Записи лент и поискового индекса ссылаются на пост
+            return shard_of_post(instance.post_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Ссылки из шарда на пользователей и группы основной базы
+        if enabled() and (
+            isinstance(obj1, SHARDED_MODELS)
+            or isinstance(obj2, SHARDED_MODELS)
+        ):
+            return True
+        return None
+
+
+def _reserve_ids(model, count):
+    name = model._meta.label_lower
+    sequences = IdSequence.objects.using(DEFAULT_DB_ALIAS)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if not sequences.filter(name=name).update(value=F('value') + count):
+            # Первый резерв: нумерация продолжает самый большой
+            # идентификатор, выданный до включения шардирования
+            start = max(
+                objects.aggregate(last=Max('pk'))['last'] or 0
+                for objects in querysets(model)
+            ) + 1
+            try:
+                with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                    sequences.create(name=name, value=start + count)
+            except IntegrityError:
+                sequences.filter(name=name).update(value=F('value') + count)
+        end = sequences.values_list('value', flat=True).get(name=name)
+    return end - count, end
+
+
+def allocate_ids(model, count=1):
+    """Идентификаторы новых строк модели, уникальные во всех шардах.
+
+    Процесс резервирует в основной базе блоки по SHARD_ID_BLOCK
+    идентификаторов и раздаёт их без запросов.
+    """
+    with _id_lock:
+        start, end = _id_blocks.get(model, (0, 0))
+        if end - start < count:
+            start, end = _reserve_ids(
+                model, max(count, settings.SHARD_ID_BLOCK)
+            )
+        _id_blocks[model] = (start + count, end)
+    return range(start, start + count)
+
+
+def claim_ids(model, ids):
+    """Явно заданные идентификаторы, которые можно занять.
+
+    Идентификатор, уже выданный allocate_ids() какому-либо процессу,
+    мог достаться другой строке в другом шарде, поэтому годятся
+    только ещё не выданные. Нумерация сдвигается за самый большой
+    из них, и allocate_ids() их больше не выдаст.
+    """
+    name = model._meta.label_lower
+    sequences = IdSequence.objects.using(DEFAULT_DB_ALIAS)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        # Пустой резерв создаёт нумерацию и блокирует её до конца
+        # транзакции
+        _, free = _reserve_ids(model, 0)
+        claimed = {pk for pk in ids if pk >= free}
+        if claimed:
+            sequences.filter(name=name).update(value=max(claimed) + 1)
+    return claimed
+
+
+def _unique(keys):
+    previous = None
+    for key in keys:
+        if key[1] != previous:
+            yield key
+        previous = key[1]
+
+
+def newest_first(queryset, date='pub_date', pk='pk'):
+    """Источник MergedFeed: ключи (date, pk) строк queryset."""
+    def keys(limit, bound=None, reverse=False):
+        rows = queryset.order_by(
+            *((date, pk) if reverse else (f'-{date}', f'-{pk}'))
+        )
+        if bound is not None:
+            lookup = 'gt' if reverse else 'lt'
+            rows = rows.filter(
+                Q(**{f'{date}__{lookup}': bound[0]})
+                | Q(**{date: bound[0], f'{pk}__{lookup}': bound[1]})
+            )
+        return list(rows.values_list(date, pk)[:limit])
+    return keys
+
+
+def _feed_posts(post_ids):
+    return in_bulk(post_ids, lambda posts: posts.for_feed())
+
+
+class MergedFeed:
+    """Лента из нескольких источников для паджинатора.
+
+    Источник - функция (limit, bound, reverse) -> не больше limit
+    ключей (pub_date, pk) строго после bound в порядке убывания,
+    при reverse - строго до bound в порядке возрастания.
+    Страница собирается k-way слиянием ключей, повторы одного поста
+    пропускаются, и загружаются только посты самой страницы.
+    """
+    model = Post
+
+    def __init__(self, sources, count, load=_feed_posts):
+        self.sources = sources
+        self._count = count
+        self._load = load
+
+    def count(self):
+        return self._count()
+
+    def __len__(self):
+        return self.count()
+
+    def _merge(self, limit, bound=None, reverse=False):
+        return _unique(heapq.merge(
+            *(source(limit, bound, reverse) for source in self.sources),
+            reverse=not reverse
+        ))
+
+    def _posts(self, keys):
+        posts = self._load([pk for _, pk in keys])
+        return [posts[pk] for _, pk in keys if pk in posts]
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        return self._posts(list(islice(self._merge(stop), start, stop)))
+
+    def keyset(self, limit, bound=None, reverse=False):
+        """Первые limit постов после ключа bound (pub_date, pk)
+        для курсорного паджинатора."""
+        if bound is not None:
+            bound = tuple(bound)
+        return self._posts(
+            list(islice(self._merge(limit, bound, reverse), limit))
+        )
+
+
+def feed_posts(queryset):
+    """Посты ленты queryset из всех шардов.
+
+    Без шардирования - сам queryset с for_feed(). С шардированием
+    каждый шард отдаёт ключи своей части страницы по индексу
+    (pub_date, id), а посты загружаются только для неё.
+    """
+    if not enabled():
+        return queryset.for_feed()
+    shard_querysets = [queryset.using(alias) for alias in databases()]
+    return MergedFeed(
+        [newest_first(posts) for posts in shard_querysets],
+        lambda: sum(posts.count() for posts in shard_querysets)
+    )
+
+
+def _copy_rows(model, queryset, target, batch_size):
+    """Копирует строки queryset в шард target пачками по pk.
+
+    Значения переносятся как есть, включая pk и даты с auto_now;
+    строки, которые уже есть в target, перезаписываются значениями
+    из queryset. Возвращает идентификаторы скопированных строк
+    по пачкам.
+    """
+    fields = model._meta.concrete_fields
+    connection = connections[target]
+    quote = connection.ops.quote_name
+    pk_column = quote(model._meta.pk.column)
+    insert = (
+        f'INSERT INTO {quote(model._meta.db_table)} ('
+        + ', '.join(quote(field.column) for field in fields)
+        + ') VALUES (' + ', '.join(['%s'] * len(fields)) + ') '
+        f'ON CONFLICT ({pk_column}) DO UPDATE SET '
+        + ', '.join(
+            f'{quote(field.column)} = excluded.{quote(field.column)}'
+            for field in fields if not field.primary_key
+        )
+    )
+    last = 0
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last).order_by('pk')
+            .values_list(*(field.attname for field in fields))[:batch_size]
+        )
+        if not rows:
+            return
+        with transaction.atomic(using=target), connection.cursor() as cursor:
+            cursor.executemany(insert, [
+                [
+                    field.get_db_prep_save(value, connection)
+                    for field, value in zip(fields, row)
+                ]
+                for row in rows
+            ])
+        last = rows[-1][0]
+        yield [row[0] for row in rows]
+
+
+def _copy_author(user_id, source, target, batch_size):
+    """Копирует посты автора и комментарии к ним; возвращает число
+    скопированных постов."""
+    copied = 0
+    posts = Post.objects.using(source).filter(author_id=user_id)
+    for post_ids in _copy_rows(Post, posts, target, batch_size):
+        comments = Comment.objects.using(source).filter(post_id__in=post_ids)
+        for _ in _copy_rows(Comment, comments, target, batch_size):
+            pass
+        copied += len(post_ids)
+    return copied
+
+
+def _forget_post_locations(user_id, alias, batch_size):
+    """Удаляет из кэша шарды постов автора, лежащих в alias."""
+    posts = Post.objects.using(alias).filter(author_id=user_id)
+    last = 0
+    while True:
+        post_ids = list(
+            posts.filter(pk__gt=last).order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not post_ids:
+            return
+        cache.delete_many([_post_key(pk) for pk in post_ids])
+        last = post_ids[-1]
+
+
+class AuthorMoving(DatabaseError):
+    """Посты автора переносятся в другой шард и пока не меняются."""
+
+
+def check_writable(author_id):
+    """Запрещает менять посты и комментарии автора во время переноса.
+
+    Иначе правки, сделанные в старом шарде после копирования,
+    потерялись бы при его очистке.
+    """
+    if enabled() and AuthorShard.objects.using(DEFAULT_DB_ALIAS).filter(
+        user_id=author_id
+    ).exclude(moving_to='', moved_from='').exists():
+        raise AuthorMoving(f'Посты автора {author_id} переносятся')
+
+
+def move_author(user_id, target, batch_size=500):
+    """Переносит посты автора и комментарии к ним в шард target.
+
+    Перенос идёт шагами, состояние которых записано в карте шардов:
+    копирование в target, переключение автора на target, повторное
+    копирование строк, изменённых до начала переноса, и удаление их
+    из старого шарда. Пока перенос идёт, посты и комментарии автора
+    не меняются (check_writable). Прерванный перенос продолжается
+    повторным вызовом. Возвращает число скопированных постов.
+    """
+    shards = AuthorShard.objects.using(DEFAULT_DB_ALIAS)
+    shards.get_or_create(user_id=user_id, defaults={'shard': databases()[0]})
+    copied = 0
+    while True:
+        row = shards.get(user_id=user_id)
+        if row.moved_from:
+            _copy_author(user_id, row.moved_from, row.shard, batch_size)
+            # Строки удаляются без каскадов и сигналов: их копии
+            # уже в новом шарде, а ленты и счётчики не меняются
+            Comment.objects.using(row.moved_from).filter(
+                post__author_id=user_id
+            )._raw_delete(row.moved_from)
+            Post.objects.using(row.moved_from).filter(
+                author_id=user_id
+            )._raw_delete(row.moved_from)
+            # Чтение между копированием и удалением могло
+            # закэшировать старый шард поста
+            _forget_post_locations(user_id, row.shard, batch_size)
+            shards.filter(pk=user_id).update(moved_from='')
+        elif row.moving_to:
+            copied += _copy_author(
+                user_id, row.shard, row.moving_to, batch_size
+            )
+            shards.filter(pk=user_id).update(
+                shard=row.moving_to, moving_to='', moved_from=row.shard
+            )
+            cache.delete(_user_key(user_id))
+            _forget_post_locations(user_id, row.moving_to, batch_size)
+        elif row.shard != target:
+            shards.filter(pk=user_id).update(moving_to=target)
+        else:
+            return copied
+
+
+def delete_author(user_id):
+    """Удаляет посты автора и его комментарии из шардов, кроме
+    основной базы: туда каскад удаления пользователя не доходит."""
+    for alias in databases():
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        Post.objects.using(alias).filter(author_id=user_id).delete()
+        Comment.objects.using(alias).filter(author_id=user_id).delete()
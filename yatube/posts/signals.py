@@ -0,0 +1,353 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import counters, feed, images, search, sharding, thumbnails
+from .caching import bump_generations, feed_scope
+from .models import (AuthorShard, Comment, Follow, Group, Post,
+                     UserCounters)
+from .paginator import count_cache_key
+
+User = get_user_model()
+
+
+def _change_counts(keys, delta):
+    """Сдвигает закэшированные числа постов.
+
+    Отсутствующие в кэше ключи пропускаются:
+    они будут посчитаны заново при следующем запросе ленты.
+    """
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
+
+
+def _count_keys(author_id, group_id):
+    keys = [count_cache_key(), count_cache_key(author=author_id)]
+    if group_id is not None:
+        keys.append(count_cache_key(group=group_id))
+    return keys
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_delete, sender=Post)
+def refuse_moving_author_posts(sender, instance, **kwargs):
+    sharding.check_writable(instance.author_id)
+
+
+@receiver(pre_save, sender=Comment)
+@receiver(pre_delete, sender=Comment)
+def refuse_moving_author_comments(sender, instance, using, **kwargs):
+    if not sharding.enabled() or instance.post_id is None:
+        return
+    post = instance._state.fields_cache.get('post')
+    if post is not None:
+        author_id = post.author_id
+    else:
+        author_id = Post.objects.using(using).filter(
+            pk=instance.post_id
+        ).values_list('author_id', flat=True).first()
+    sharding.check_writable(author_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_group(sender, instance, using, **kwargs):
+    """Запоминает группу и изображение поста до редактирования."""
+    instance._previous_group_id = None
+    instance._previous_image = ''
+    if instance.pk is not None:
+        previous = (
+            Post.objects.using(using).filter(pk=instance.pk)
+            .values_list('group_id', 'image').first()
+        )
+        if previous is not None:
+            instance._previous_group_id, instance._previous_image = previous
+    if instance.image.name != instance._previous_image:
+        # Миниатюры старой картинки новой не подходят
+        instance.image_renditions = ''
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def allocate_sharded_id(sender, instance, **kwargs):
+    """Выдаёт новой строке идентификатор, общий для всех шардов."""
+    if sharding.enabled() and instance.pk is None:
+        instance.pk = sharding.allocate_ids(sender)[0]
+
+
+@receiver(pre_save, sender=Post)
+def describe_uploaded_image(sender, instance, **kwargs):
+    """Описывает загруженную картинку и ищет такую же среди сохранённых."""
+    if not instance.image:
+        images.clear(instance)
+    elif not instance.image._committed:
+        for field, value in images.describe(instance.image).items():
+            setattr(instance, field, value)
+        images.deduplicate(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        _change_counts(_count_keys(instance.author_id, instance.group_id), 1)
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id == instance.group_id:
+        return
+    if previous_group_id is not None:
+        _change_counts([count_cache_key(group=previous_group_id)], -1)
+    if instance.group_id is not None:
+        _change_counts([count_cache_key(group=instance.group_id)], 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    _change_counts(_count_keys(instance.author_id, instance.group_id), -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created:
+        feed.backfill(instance.user, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_feed(sender, instance, **kwargs):
+    feed.prune(instance.user, instance.author)
+
+
+def _post_scopes(post, group_ids):
+    scopes = [
+        feed_scope('index'),
+        feed_scope('author', post.author.username),
+    ]
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True
+    )
+    scopes.extend(feed_scope('group', slug) for slug in slugs)
+    return scopes
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post_pages(sender, instance, **kwargs):
+    group_ids = {
+        instance.group_id, getattr(instance, '_previous_group_id', None)
+    }
+    bump_generations(*_post_scopes(instance, group_ids - {None}))
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_pages(sender, instance, **kwargs):
+    group_ids = {instance.group_id} - {None}
+    bump_generations(*_post_scopes(instance, group_ids))
+
+
+# Поля, которые показываются в карточках постов всех лент
+CARD_FIELDS = {
+    Group: ('title', 'slug'),
+    User: ('username', 'first_name', 'last_name'),
+}
+
+
+@receiver(pre_save, sender=Group)
+@receiver(pre_save, sender=User)
+def remember_card_fields(sender, instance, using, update_fields, **kwargs):
+    """Запоминает поля карточек до сохранения группы или автора."""
+    fields = CARD_FIELDS[sender]
+    instance._previous_card_fields = None
+    # Вход пользователя сохраняет только last_login
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    if instance.pk is not None:
+        instance._previous_card_fields = (
+            sender.objects.using(using).filter(pk=instance.pk)
+            .values(*fields).first()
+        )
+
+
+def _card_fields_changed(instance):
+    """Прежние поля карточек, если они изменились при сохранении."""
+    previous = getattr(instance, '_previous_card_fields', None)
+    if previous is None:
+        return None
+    for field, value in previous.items():
+        if getattr(instance, field) != value:
+            return previous
+    return None
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_pages(sender, instance, **kwargs):
+    scopes = [feed_scope('group', instance.slug)]
+    previous = _card_fields_changed(instance)
+    if previous is not None:
+        # Название группы есть в карточках её постов во всех лентах
+        author_ids = set()
+        for posts in sharding.querysets(Post):
+            author_ids.update(
+                posts.filter(group_id=instance.pk)
+                .values_list('author_id', flat=True).distinct()
+            )
+        usernames = User.objects.filter(pk__in=author_ids).values_list(
+            'username', flat=True
+        )
+        scopes.append(feed_scope('index'))
+        scopes.append(feed_scope('group', previous['slug']))
+        scopes.extend(feed_scope('author', name) for name in usernames)
+    bump_generations(*scopes)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_pages(sender, instance, created, **kwargs):
+    previous = _card_fields_changed(instance)
+    if created or previous is None:
+        return
+    group_ids = set(
+        instance.posts.exclude(group=None)
+        .values_list('group_id', flat=True).distinct()
+    )
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True
+    )
+    bump_generations(
+        feed_scope('index'),
+        feed_scope('author', instance.username),
+        feed_scope('author', previous['username']),
+        *(feed_scope('group', slug) for slug in slugs)
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_profile_pages(sender, instance, **kwargs):
+    # Профиль автора показывает число подписчиков, профиль
+    # подписчика - число подписок
+    bump_generations(
+        feed_scope('author', instance.author.username),
+        feed_scope('author', instance.user.username)
+    )
+
+
+@receiver(post_save, sender=User)
+def create_user_counters(sender, instance, created, **kwargs):
+    if created:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def place_author(sender, instance, created, **kwargs):
+    if created and sharding.enabled():
+        AuthorShard.objects.get_or_create(
+            user=instance,
+            defaults={'shard': sharding.placement(instance.pk)}
+        )
+
+
+@receiver(pre_delete, sender=User)
+def delete_author_rows(sender, instance, **kwargs):
+    # Каскад удаления пользователя не доходит до других шардов
+    if sharding.enabled():
+        sharding.delete_author(instance.pk)
+
+
+@receiver(connection_created)
+def disable_shard_foreign_keys(sender, connection, **kwargs):
+    """Снимает проверку внешних ключей в шардах.
+
+    Посты и комментарии в шарде ссылаются на пользователей
+    и группы основной базы, которых в шарде нет.
+    """
+    if connection.alias in settings.POST_SHARDS:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA foreign_keys = OFF')
+
+
+@receiver(post_save, sender=Post)
+def count_author_and_group_posts(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counters(instance.author_id, posts_count=1)
+        if instance.group_id is not None:
+            counters.change_group_posts(instance.group_id, 1)
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id == instance.group_id:
+        return
+    if previous_group_id is not None:
+        counters.change_group_posts(previous_group_id, -1)
+    if instance.group_id is not None:
+        counters.change_group_posts(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_author_and_group_posts(sender, instance, **kwargs):
+    counters.change_user_counters(instance.author_id, posts_count=-1)
+    if instance.group_id is not None:
+        counters.change_group_posts(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_post_comments(sender, instance, created, **kwargs):
+    if created and instance.post_id is not None:
+        counters.change_post_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_post_comments(sender, instance, **kwargs):
+    if instance.post_id is not None:
+        counters.change_post_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counters(instance.author_id, followers_count=1)
+        counters.change_user_counters(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    counters.change_user_counters(instance.author_id, followers_count=-1)
+    counters.change_user_counters(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def switch_feed_mode(sender, instance, created, **kwargs):
+    if created:
+        feed.switch_mode(instance.author, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def switch_feed_mode_back(sender, instance, **kwargs):
+    feed.switch_mode(instance.author, -1)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def generate_thumbnails(sender, instance, **kwargs):
+    previous_image = getattr(instance, '_previous_image', '')
+    if (
+        instance.image and instance.image.name != previous_image
+        and not instance.image_renditions
+    ):
+        thumbnails.schedule(instance)
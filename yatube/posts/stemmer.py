@@ -0,0 +1,124 @@
+"""Стеммер русского языка по алгоритму Snowball (Портера)."""
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = (
+    (),
+    (
+        'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой',
+        'ем', 'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых',
+        'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+    ),
+)
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (
+    (
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+    ),
+    (
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+        'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+        'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    ),
+)
+NOUN = (
+    (),
+    (
+        'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+        'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+        'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+        'ья', 'я',
+    ),
+)
+SUPERLATIVE = ((), ('ейш', 'ейше'))
+DERIVATIONAL = ('ость', 'ост')
+
+
+def _regions(word):
+    """Начала областей RV и R2 слова."""
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(rv, endings):
+    """Удаляет самое длинное из окончаний или возвращает None.
+
+    Окончания первой группы должны следовать за «а» или «я».
+    """
+    after_a, plain = endings
+    longest = ''
+    for ending in after_a + plain:
+        if rv.endswith(ending) and len(ending) > len(longest):
+            longest = ending
+    if not longest:
+        return None
+    stem = rv[:-len(longest)]
+    if longest in after_a and longest not in plain:
+        if not stem or stem[-1] not in 'ая':
+            return None
+    return stem
+
+
+def _strip_inflection(rv):
+    stem = _strip(rv, PERFECTIVE_GERUND)
+    if stem is not None:
+        return stem
+    stem = _strip(rv, REFLEXIVE)
+    if stem is not None:
+        rv = stem
+    stem = _strip(rv, ADJECTIVE)
+    if stem is not None:
+        participle = _strip(stem, PARTICIPLE)
+        return stem if participle is None else participle
+    for endings in (VERB, NOUN):
+        stem = _strip(rv, endings)
+        if stem is not None:
+            return stem
+    return rv
+
+
+def stem(word):
+    """Возвращает основу русского слова в нижнем регистре."""
+    word = word.lower().replace('ё', 'е')
+    rv_start, r2_start = _regions(word)
+    prefix, rv = word[:rv_start], word[rv_start:]
+    rv = _strip_inflection(rv)
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    for ending in DERIVATIONAL:
+        if rv.endswith(ending):
+            if rv_start + len(rv) - len(ending) >= r2_start:
+                rv = rv[:-len(ending)]
+            break
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        superlative = _strip(rv, SUPERLATIVE)
+        if superlative is not None:
+            rv = superlative
+            if rv.endswith('нн'):
+                rv = rv[:-1]
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+    return prefix + rv
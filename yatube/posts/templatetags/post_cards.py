@@ -0,0 +1,57 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+CARD_TEMPLATE = 'includes/post_card.html'
+
+
+def card_cache_key(post):
+    """Ключ карточки поста.
+
+    Версия меняется при редактировании поста, а также при смене
+    имени автора или названия группы, при появлении миниатюр
+    и переносе файла картинки, поэтому такие изменения
+    не требуют отдельного сброса кэша.
+    """
+    author = post.author
+    group = post.group
+    version = '|'.join(str(value) for value in (
+        post.updated.isoformat(), post.image.name, post.image_renditions,
+        author.username, author.first_name, author.last_name,
+        group.slug if group else '', group.title if group else '',
+    ))
+    digest = hashlib.md5(version.encode()).hexdigest()
+    return f'posts:card:{post.pk}:{digest}'
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Возвращает отрендеренные карточки постов ленты.
+
+    Готовые карточки берутся из кэша одним запросом get_many,
+    отсутствующие рендерятся и сохраняются одним set_many.
+    Карточка, где вместо миниатюры пока показан оригинал
+    изображения, не кэшируется.
+    """
+    posts = list(posts)
+    keys = [card_cache_key(post) for post in posts]
+    cached = cache.get_many(keys)
+    rendered = {}
+    for key, post in zip(keys, posts):
+        if key in cached:
+            continue
+        card = render_to_string(CARD_TEMPLATE, {'post': post})
+        if post.image and not post.image_renditions:
+            cached[key] = card
+        else:
+            rendered[key] = card
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_TIMEOUT)
+        cached.update(rendered)
+    return [mark_safe(cached[key]) for key in keys]
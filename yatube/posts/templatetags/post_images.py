@@ -0,0 +1,15 @@
+from django import template
+
+from .. import thumbnails
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_image(post):
+    """Изображение поста с миниатюрами разных ширин и форматов.
+
+    В отличие от тега thumbnail из sorl-thumbnail, не создаёт
+    миниатюры во время рендеринга, а ставит их в очередь.
+    """
+    return {'image': thumbnails.picture(post)}
@@ -0,0 +1,20 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from .. import fragments
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def user_fragment(context, name, argument=''):
+    """Фрагмент страницы, зависящий от пользователя.
+
+    В общей для всех пользователей странице, которую кэширует
+    cache_feed, на его месте остаётся метка: фрагмент
+    подставляется при каждой отдаче страницы.
+    """
+    request = context['request']
+    if getattr(request, 'page_shell', False):
+        return mark_safe(fragments.placeholder(name, argument))
+    return mark_safe(fragments.render_fragment(request, name, argument))
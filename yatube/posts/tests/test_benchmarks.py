@@ -0,0 +1,29 @@
+from django.test import TestCase
+
+from .. import benchmarks
+
+
+class FeedIndexesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        benchmarks.generate_dataset(posts=500, users=20, groups=3, follows=5)
+
+    def test_dataset_is_generated(self):
+        paths = benchmarks.access_paths()
+        for name, queryset in paths.items():
+            with self.subTest(name=name):
+                self.assertTrue(queryset.exists())
+
+    def test_feeds_are_read_in_index_order(self):
+        """Ленты группы, автора и подписок читаются по индексам."""
+        paths = benchmarks.access_paths()
+        indexes = {
+            'group_posts': 'post_group_pub_date_idx',
+            'profile': 'post_author_pub_date_idx',
+            'follow_index': 'feed_user_pub_date_post_idx',
+        }
+        for name, index in indexes.items():
+            with self.subTest(name=name):
+                result = benchmarks.measure(paths[name], repeat=1)
+                self.assertIn(index, result['plan'])
+                self.assertNotIn('TEMP B-TREE', result['plan'])
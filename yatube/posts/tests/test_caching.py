@@ -0,0 +1,198 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase
+from django.urls import reverse
+
+from ..caching import (bump_generations, cache_feed, get_metrics,
+                       page_cache_key, reset_metrics)
+from ..models import Follow, Group, Post
+
+User = get_user_model()
+
+
+class CacheFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_metrics()
+        self.calls = 0
+
+        @cache_feed('index')
+        def view(request):
+            self.calls += 1
+            return HttpResponse(f'page {self.calls}')
+
+        self.view = view
+        self.request = RequestFactory().get('/')
+        self.request.user = AnonymousUser()
+
+    def test_page_is_served_from_cache_until_bump(self):
+        """Страница берётся из кэша до смены поколения области."""
+        self.view(self.request)
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'page 1')
+        bump_generations('index')
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'page 2')
+        self.assertEqual(
+            get_metrics(),
+            {'hits': 1, 'misses': 2, 'stale': 0, 'lock_waits': 0}
+        )
+
+    def test_stale_page_is_served_while_locked(self):
+        """Пока страницу перестраивает другой запрос, отдаётся старая."""
+        self.view(self.request)
+        key = page_cache_key(self.request, 'view', ['index'])
+        response, _, generations = cache.get(key)
+        cache.set(key, (response, time.time() - 1, generations))
+        cache.add(f'{key}:lock', 1)
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'page 1')
+        self.assertEqual(get_metrics()['stale'], 1)
+        cache.delete(f'{key}:lock')
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'page 2')
+
+    def test_previous_generation_is_served_while_locked(self):
+        """После смены поколения, пока новую страницу строит
+        другой запрос, отдаётся последняя построенная."""
+        self.view(self.request)
+        bump_generations('index')
+        key = page_cache_key(self.request, 'view', ['index'])
+        cache.add(f'{key}:lock', 1)
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'page 1')
+        self.assertEqual(get_metrics()['stale'], 1)
+        cache.delete(f'{key}:lock')
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'page 2')
+
+
+class SharedShellTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        Post.objects.create(text='test_text', author=cls.author)
+        cls.url = reverse('posts:profile', args=(cls.author.username,))
+
+    def setUp(self):
+        cache.clear()
+        reset_metrics()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.follower)
+
+    def test_guest_request_does_not_touch_session(self):
+        """Гостю страница отдаётся без чтения сессии и Vary: Cookie."""
+        response = self.guest_client.get(self.url)
+        self.assertFalse(response.wsgi_request.session.accessed)
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertContains(response, 'Войти')
+
+    def test_users_share_cached_page(self):
+        """Гость и пользователь получают одну запись кэша,
+        но каждый - со своими меню и кнопкой подписки."""
+        guest_response = self.guest_client.get(self.url)
+        response = self.authorized_client.get(self.url)
+        self.assertEqual(get_metrics()['hits'], 1)
+        self.assertContains(response, 'Пользователь: follower')
+        self.assertContains(response, 'Отписаться')
+        self.assertNotContains(response, 'user-fragment')
+        self.assertContains(guest_response, 'Подписаться')
+        self.assertNotContains(guest_response, 'Пользователь:')
+
+    def test_switcher_is_rendered_per_user(self):
+        """Вкладки лент в общей странице зависят от пользователя,
+        кто бы ни прогрел кэш."""
+        url = reverse('posts:main_page')
+        for warmed_by, first, second in (
+            ('guest', self.guest_client, self.authorized_client),
+            ('user', self.authorized_client, self.guest_client),
+        ):
+            with self.subTest(warmed_by=warmed_by):
+                cache.clear()
+                responses = {
+                    client: client.get(url) for client in (first, second)
+                }
+                self.assertNotContains(
+                    responses[self.guest_client], 'Избранные авторы'
+                )
+                self.assertContains(
+                    responses[self.authorized_client], 'Избранные авторы'
+                )
+
+
+class PostCardsTest(TestCase):
+    template = Template(
+        '{% load post_cards %}{% post_cards posts as cards %}'
+        '{% for card in cards %}{{ card }}{% endfor %}'
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test_username')
+        cls.group = Group.objects.create(
+            title='test_group',
+            slug='test_slug',
+            description='test_description',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='test_text', author=self.user, group=self.group
+        )
+
+    def render(self):
+        posts = Post.objects.for_feed()
+        return self.template.render(Context({'posts': posts}))
+
+    def test_warm_cards_are_not_rendered_again(self):
+        """Карточки из кэша не рендерятся повторно."""
+        first = self.render()
+        with self.assertTemplateNotUsed('includes/post_card.html'):
+            second = self.render()
+        self.assertEqual(first, second)
+
+    def test_card_changes_on_post_edit_and_renames(self):
+        """Карточка обновляется при правке поста и переименованиях."""
+        self.render()
+        self.post.text = 'edited_text'
+        self.post.save()
+        self.assertIn('edited_text', self.render())
+        self.user.first_name = 'Новое'
+        self.user.save()
+        self.assertIn('Новое', self.render())
+        self.group.title = 'renamed_group'
+        self.group.save()
+        self.assertIn('renamed_group', self.render())
+
+    def test_feed_pages_change_on_renames(self):
+        """Переименование группы или автора сбрасывает страницы лент,
+        где видны их карточки."""
+        client = Client()
+        urls = [
+            reverse('posts:main_page'),
+            reverse('posts:profile', args=(self.user.username,)),
+        ]
+        for url in urls:
+            client.get(url)
+        self.group.title = 'renamed_group'
+        self.group.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(client.get(url), 'renamed_group')
+        urls.append(reverse('posts:group_list', args=(self.group.slug,)))
+        self.user.first_name = 'Новое'
+        self.user.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(client.get(url), 'Новое')
@@ -0,0 +1,95 @@
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from .. import exporting
+from ..models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class ExportPostsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description=''
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, group=cls.group, text='текст, с запятой'
+            ),
+            Post.objects.create(author=cls.author, text='второй'),
+        ]
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        cls.comment = Comment.objects.create(
+            post=cls.posts[0], author=cls.staff, text='комментарий'
+        )
+
+    def test_rows_join_author_and_group_in_batches(self):
+        rows = list(exporting.rows(batch_size=1))
+        self.assertEqual([row['id'] for row in rows], [
+            post.pk for post in self.posts
+        ])
+        self.assertEqual(rows[0]['author'], 'author')
+        self.assertEqual(rows[0]['group'], 'group')
+        self.assertIsNone(rows[1]['group'])
+
+    def test_command_writes_gzipped_jsonl(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'posts.jsonl.gz')
+        call_command(
+            'export_posts', output=path, gzip=True, stdout=io.StringIO()
+        )
+        with gzip.open(path, 'rt', encoding='utf-8') as exported:
+            rows = [json.loads(line) for line in exported]
+        self.assertEqual(rows[0]['text'], 'текст, с запятой')
+        self.assertEqual(len(rows), len(self.posts))
+
+    def test_view_streams_csv_to_staff_only(self):
+        url = reverse('posts:export_posts')
+        client = Client()
+        client.force_login(self.author)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 302)
+        client.force_login(self.staff)
+        response = client.get(url, {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        header, *rows = csv.reader(io.StringIO(content))
+        self.assertEqual(header, list(exporting.FIELDS))
+        self.assertEqual(rows[0][3], 'текст, с запятой')
+        self.assertIn('posts.csv', response['Content-Disposition'])
+
+    def test_comments_are_exported_in_import_format(self):
+        row, = exporting.rows(batch_size=1, kind=exporting.COMMENTS)
+        self.assertEqual(row, {
+            'id': self.comment.pk,
+            'post': self.posts[0].pk,
+            'author': 'staff',
+            'text': 'комментарий',
+            'created': self.comment.created.isoformat(),
+        })
+
+    def test_view_streams_comments(self):
+        client = Client()
+        client.force_login(self.staff)
+        response = client.get(
+            reverse('posts:export_posts'),
+            {'kind': 'comments', 'format': 'csv'}
+        )
+        content = b''.join(response.streaming_content).decode()
+        header, row = csv.reader(io.StringIO(content))
+        self.assertEqual(header, list(exporting.COMMENT_FIELDS))
+        self.assertEqual(row[3], 'комментарий')
+        self.assertIn('comments.csv', response['Content-Disposition'])
@@ -0,0 +1,88 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import FeedEntry, Follow, Post
+
+User = get_user_model()
+
+
+class FeedEntryTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Test_author')
+        cls.user = User.objects.create_user(username='Test_username')
+        cls.post = Post.objects.create(text='test_text', author=cls.author)
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+
+    def test_follow_backfills_and_unfollow_prunes_feed(self):
+        """Подписка добавляет посты автора в ленту, отписка убирает."""
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=(self.author.username,))
+        )
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user, post=self.post).exists()
+        )
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,))
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='new_text', author=self.author)
+        entry = FeedEntry.objects.get(user=self.user, post=post)
+        self.assertEqual(entry.pub_date, post.pub_date)
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_big_author_posts_are_pulled_on_read(self):
+        """Посты крупного автора не рассылаются, но видны в ленте."""
+        Follow.objects.create(user=self.user, author=self.author)
+        FeedEntry.objects.all().delete()
+        post = Post.objects.create(text='new_text', author=self.author)
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'].object_list)
+
+    @override_settings(FEED_FANOUT_LIMIT=1, SHOW_POSTS=2)
+    def test_follow_index_pages_by_cursor(self):
+        """Курсор листает разосланные и подмешанные посты по порядку."""
+        big_author = User.objects.create_user(username='Big_author')
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=big_author)
+        Follow.objects.create(user=self.author, author=big_author)
+        posts = [self.post] + [
+            Post.objects.create(text=f'text_{number}', author=author)
+            for number, author in enumerate(
+                (big_author, self.author, big_author, self.author)
+            )
+        ]
+        shown = []
+        cursor = ''
+        while cursor is not None:
+            response = self.authorized_client.get(
+                reverse('posts:follow_index'), {'cursor': cursor}
+            )
+            page_obj = response.context['page_obj']
+            shown.extend(page_obj.object_list)
+            cursor = page_obj.next_cursor
+        self.assertEqual(shown, posts[::-1])
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_author_switches_between_fan_out_and_pull(self):
+        """Автор, пересёкший порог, не дублируется и не пропадает."""
+        reader = User.objects.create_user(username='Test_reader')
+        Follow.objects.create(user=self.user, author=self.author)
+        follow = Follow.objects.create(user=reader, author=self.author)
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+        post = Post.objects.create(text='new_text', author=self.author)
+        follow.delete()
+        self.assertEqual(
+            set(FeedEntry.objects.values_list('user', 'post')),
+            {(self.user.pk, self.post.pk), (self.user.pk, post.pk)}
+        )
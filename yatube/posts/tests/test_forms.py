@@ -1,6 +1,9 @@
+import shutil
+import tempfile
+
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 from ..forms import PostForm
@@ -8,7 +11,11 @@ from ..models import Comment, Group, Post
 
 User = get_user_model()
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
 
+# Миниатюры создаются в процессе теста и в его временном каталоге
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class UserFormCreateTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -50,6 +57,11 @@ class UserFormCreateTest(TestCase):
         cls.authorized_client = Client()
         cls.authorized_client.force_login(cls.user)
 
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
     def test_create_post(self):
         """При отправке валидной формы со страницы создания поста
         создаётся новая запись в базе данных.
@@ -0,0 +1,146 @@
+import hashlib
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageMetadataTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test_username')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, name='small.gif', content=SMALL_GIF):
+        return Post.objects.create(
+            text='test_text',
+            author=self.user,
+            image=SimpleUploadedFile(name, content, 'image/gif'),
+        )
+
+    def test_metadata_is_stored_on_upload(self):
+        """При загрузке сохраняются размеры, формат и хеш картинки."""
+        post = self.create_post()
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertEqual(post.image_size, len(SMALL_GIF))
+        self.assertEqual(post.image_format, 'GIF')
+        self.assertEqual(
+            post.image_hash, hashlib.sha256(SMALL_GIF).hexdigest()
+        )
+
+    def test_upload_path_is_sharded(self):
+        """Картинка сохраняется в каталог по хешу содержимого."""
+        post = self.create_post()
+        digest = hashlib.sha256(SMALL_GIF).hexdigest()
+        self.assertEqual(
+            post.image.name, f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+        )
+
+    def test_identical_upload_reuses_file(self):
+        """Одинаковая картинка хранится одним файлом с общими миниатюрами."""
+        first = self.create_post()
+        Post.objects.filter(pk=first.pk).update(image_renditions='{}')
+        second = self.create_post(name='copy.gif')
+        second.refresh_from_db()
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(second.image_renditions, '{}')
+
+    def test_removed_image_clears_metadata(self):
+        """Удаление картинки сбрасывает её описание."""
+        post = self.create_post()
+        post.image = None
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_hash, '')
+
+    def test_backfill_command(self):
+        """Команда описывает картинки постов, сохранённых без описания."""
+        post = self.create_post()
+        Post.objects.filter(pk=post.pk).update(
+            image_width=None, image_hash=''
+        )
+        call_command(
+            'fill_image_metadata', batch_size=1, stdout=mock.Mock()
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.image_width, 2)
+        self.assertEqual(
+            post.image_hash, hashlib.sha256(SMALL_GIF).hexdigest()
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ShardImagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test_username')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.digest = hashlib.sha256(SMALL_GIF).hexdigest()
+        self.new_name = (
+            f'posts/{self.digest[:2]}/{self.digest[2:4]}/{self.digest}.gif'
+        )
+        self.old_name = default_storage.save(
+            'posts/legacy.gif', ContentFile(SMALL_GIF)
+        )
+        self.posts = Post.objects.bulk_create(
+            Post(text=f'test_text_{i}', author=self.user, image=self.old_name)
+            for i in range(2)
+        )
+
+    def tearDown(self):
+        for name in (self.old_name, self.new_name):
+            if default_storage.exists(name):
+                default_storage.delete(name)
+
+    def test_files_are_moved(self):
+        """Команда переносит файл и переключает на него все посты."""
+        call_command('shard_images', batch_size=1, stdout=mock.Mock())
+        images = Post.objects.values_list('image', 'image_hash')
+        self.assertEqual(set(images), {(self.new_name, self.digest)})
+        self.assertFalse(default_storage.exists(self.old_name))
+        with default_storage.open(self.new_name) as moved:
+            self.assertEqual(moved.read(), SMALL_GIF)
+
+    def test_interrupted_copy_is_replaced(self):
+        """Неполная копия от прерванного запуска копируется заново."""
+        default_storage.save(self.new_name, ContentFile(SMALL_GIF[:10]))
+        call_command('shard_images', stdout=mock.Mock())
+        self.assertEqual(default_storage.size(self.new_name), len(SMALL_GIF))
+        self.assertFalse(
+            Post.objects.exclude(image=self.new_name).exists()
+        )
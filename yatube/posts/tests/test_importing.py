@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import Comment, FeedEntry, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ImportPostsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description=''
+        )
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write(content)
+        return path
+
+    def call(self, path, **options):
+        output = StringIO()
+        call_command('import_posts', path, stdout=output, **options)
+        return output.getvalue()
+
+    def test_posts_are_imported_from_jsonl(self):
+        records = [
+            {'id': 10, 'author': 'author', 'group': 'group', 'text': 'first',
+             'pub_date': '2020-01-02T03:04:05+00:00'},
+            {'author': 'author', 'text': 'second'},
+            {'author': 'unknown', 'text': 'skipped'},
+            {'author': 'author', 'group': 'unknown', 'text': 'skipped'},
+        ]
+        path = self.write('posts.jsonl', '\n'.join(map(json.dumps, records)))
+        output = self.call(path, batch_size=2)
+        self.assertIn('загружено 2, пропущено 2', output)
+        post = Post.objects.get(pk=10)
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(
+            post.pub_date, datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        )
+        self.assertEqual(post.updated, post.pub_date)
+        self.author.counters.refresh_from_db()
+        self.assertEqual(self.author.counters.posts_count, 2)
+
+    def test_comments_are_imported_from_csv(self):
+        post = Post.objects.create(author=self.author, text='text')
+        path = self.write(
+            'comments.csv',
+            'post,author,text,created\n'
+            f'{post.pk},reader,comment,2021-05-06 07:08:09\n'
+            f'{post.pk + 1},reader,no post,\n'
+        )
+        output = self.call(path, kind='comments')
+        self.assertIn('загружено 1, пропущено 1', output)
+        comment = Comment.objects.get()
+        self.assertEqual(comment.post, post)
+        self.assertEqual(comment.created.year, 2021)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_follows_ignore_duplicates_and_fill_feeds(self):
+        post = Post.objects.create(author=self.author, text='text')
+        records = [
+            {'user': 'reader', 'author': 'author'},
+            {'user': 'reader', 'author': 'author'},
+            {'user': 'reader', 'author': 'reader'},
+        ]
+        path = self.write('follows.jsonl', '\n'.join(map(json.dumps, records)))
+        self.call(path, kind='follows')
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=post).exists()
+        )
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Comment, Group, Post
+from ..models import Comment, Follow, Group, Post, UserCounters
 
 User = get_user_model()
 
@@ -71,3 +74,63 @@ class UserModelTest(TestCase):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value
                 )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.author = User.objects.create_user(username='Test_author')
+        cls.user = User.objects.create_user(username='Test_username')
+
+    def assertCounters(self, post, posts, group_posts, comments):
+        self.author.counters.refresh_from_db()
+        self.group.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(self.author.counters.posts_count, posts)
+        self.assertEqual(self.group.posts_count, group_posts)
+        self.assertEqual(post.comments_count, comments)
+
+    def test_counters_follow_creates_and_deletes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(
+            text='test_text', author=self.author, group=self.group
+        )
+        comment = Comment.objects.create(
+            text='test_comment', author=self.user, post=post
+        )
+        self.assertCounters(post, 1, 1, 1)
+        comment.delete()
+        post.group = None
+        post.save()
+        self.assertCounters(post, 1, 0, 0)
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(
+            UserCounters.objects.get(user=self.author).followers_count, 1
+        )
+        self.assertEqual(
+            UserCounters.objects.get(user=self.user).following_count, 1
+        )
+        follow.delete()
+        self.assertEqual(
+            UserCounters.objects.get(user=self.author).followers_count, 0
+        )
+
+    def test_recount_command_repairs_drift(self):
+        """Команда recount_counters исправляет расхождения счётчиков."""
+        post = Post.objects.create(
+            text='test_text', author=self.author, group=self.group
+        )
+        Comment.objects.create(
+            text='test_comment', author=self.user, post=post
+        )
+        UserCounters.objects.filter(user=self.author).delete()
+        Group.objects.update(posts_count=7)
+        Post.objects.update(comments_count=7)
+        call_command('recount_counters', batch_size=1, stdout=StringIO())
+        self.assertCounters(post, 1, 1, 1)
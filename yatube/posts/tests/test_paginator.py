@@ -0,0 +1,146 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import Post
+from ..paginator import CountedPaginator, CursorPaginator, count_cache_key
+
+User = get_user_model()
+
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test_username')
+        Post.objects.bulk_create(
+            Post(text=f'test_text_{i}', author=cls.user) for i in range(25)
+        )
+        # Половина постов с одинаковой датой: порядок решает id
+        Post.objects.filter(
+            pk__in=Post.objects.values_list('pk', flat=True)[:12]
+        ).update(pub_date=timezone.now())
+        cls.guest_client = Client()
+
+    def test_pages_cover_all_posts_once(self):
+        """Курсоры next обходят ленту без пропусков и повторов."""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        page = paginator.get_page(None)
+        seen = list(page.object_list)
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen.extend(page.object_list)
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        self.assertEqual(seen, expected)
+
+    def test_previous_cursor_returns_same_page(self):
+        """Курсор previous возвращает на предыдущую страницу."""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        first = paginator.get_page(None)
+        second = paginator.get_page(first.next_cursor)
+        back = paginator.get_page(second.previous_cursor)
+        self.assertEqual(list(back.object_list), list(first.object_list))
+        self.assertFalse(back.has_previous())
+
+    def test_invalid_cursor_gives_first_page(self):
+        """Испорченный курсор отдаёт первую страницу."""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        for cursor in ('', 'garbage', 'W10', '!!!'):
+            with self.subTest(cursor=cursor):
+                page = paginator.get_page(cursor)
+                self.assertFalse(page.has_previous())
+                self.assertEqual(len(page.object_list), 10)
+
+    def test_views_accept_cursor(self):
+        """Ленты отдают страницу по ?cursor= и ссылку на следующую."""
+        cache.clear()
+        urls = (
+            reverse('posts:main_page'),
+            reverse('posts:profile', args=(self.user.username,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url + '?cursor=')
+                page_obj = response.context['page_obj']
+                self.assertEqual(len(page_obj.object_list), 10)
+                self.assertContains(
+                    response, f'?cursor={page_obj.next_cursor}'
+                )
+
+
+class CountedPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test_username')
+        Post.objects.bulk_create(
+            Post(text=f'test_text_{i}', author=cls.user) for i in range(25)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_count_is_served_from_cache(self):
+        """Число постов считается один раз и берётся из кэша."""
+        key = count_cache_key(author=self.user.pk)
+        CountedPaginator(Post.objects.all(), 10, count_key=key).count
+        with self.assertNumQueries(0):
+            paginator = CountedPaginator(
+                Post.objects.all(), 10, count_key=key
+            )
+            self.assertEqual(paginator.count, 25)
+
+    def test_create_and_delete_update_cached_count(self):
+        """Создание и удаление поста меняют число в кэше."""
+        key = count_cache_key(author=self.user.pk)
+        CountedPaginator(Post.objects.all(), 10, count_key=key).count
+        post = Post.objects.create(text='new_text', author=self.user)
+        self.assertEqual(cache.get(key), 26)
+        post.delete()
+        self.assertEqual(cache.get(key), 25)
+
+    def test_count_over_limit_is_approximate(self):
+        """Сверх предела число приблизительное и не кэшируется."""
+        key = count_cache_key()
+        paginator = CountedPaginator(
+            Post.objects.all(), 10, count_key=key, count_limit=15
+        )
+        self.assertEqual(paginator.count, 16)
+        self.assertFalse(paginator.count_is_exact)
+        self.assertIsNone(cache.get(key))
+
+
+class ElidedPageRangeTest(TestCase):
+    def test_page_range_is_windowed(self):
+        """Номера страниц: края и соседи текущей, остальное пропущено."""
+        paginator = CountedPaginator(range(1000), 10)
+        self.assertEqual(
+            paginator.get_elided_page_range(50),
+            [1, '…', 48, 49, 50, 51, 52, '…', 100]
+        )
+        self.assertEqual(
+            paginator.get_elided_page_range(1), [1, 2, 3, '…', 100]
+        )
+        self.assertEqual(
+            paginator.get_elided_page_range(100), [1, '…', 98, 99, 100]
+        )
+
+    def test_small_page_range_is_not_elided(self):
+        """Немного страниц показываются все."""
+        paginator = CountedPaginator(range(40), 10)
+        self.assertEqual(paginator.get_elided_page_range(2), [1, 2, 3, 4])
+
+    def test_approximate_count_hides_last_pages(self):
+        """При приблизительном числе последние страницы не показываются."""
+        user = User.objects.create_user(username='Test_username')
+        Post.objects.bulk_create(
+            Post(text=f'test_text_{i}', author=user) for i in range(25)
+        )
+        paginator = CountedPaginator(
+            Post.objects.all(), 2, count_limit=20
+        )
+        self.assertEqual(
+            paginator.get_elided_page_range(6), [1, '…', 4, 5, 6, 7, 8]
+        )
@@ -0,0 +1,124 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from .. import search
+from ..models import Post
+from ..stemmer import stem
+
+User = get_user_model()
+
+
+class StemmerTest(TestCase):
+    def test_word_forms_share_stem(self):
+        """Формы слова приводятся к одной основе."""
+        forms = {
+            'книга': ('книги', 'книгами', 'книгу'),
+            'красивый': ('красивые', 'красивая', 'красивого'),
+            'читать': ('читали', 'читает'),
+        }
+        for word, word_forms in forms.items():
+            for form in word_forms:
+                with self.subTest(form=form):
+                    self.assertEqual(stem(form), stem(word))
+
+    def test_tokenize_skips_stop_words(self):
+        """Служебные слова не индексируются."""
+        self.assertEqual(search.tokenize('Книги и ЁЛКИ'), ['книг', 'елк'])
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test_username')
+        cls.cats = Post.objects.create(
+            text='Кошки любят рыбу. Кошка спит.', author=cls.user
+        )
+        cls.dogs = Post.objects.create(
+            text='Собаки любят кости', author=cls.user
+        )
+        cls.guest_client = Client()
+
+    def test_search_and_or_modes(self):
+        """Поиск находит формы слов; AND требует все слова."""
+        self.assertEqual(search.search('кошками'), [self.cats.pk])
+        self.assertEqual(search.search('кошка кости'), [])
+        self.assertCountEqual(
+            search.search('кошка кости', search.OR),
+            [self.cats.pk, self.dogs.pk]
+        )
+
+    def test_index_follows_edit_and_delete(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.create(text='Собаки любят мячи', author=self.user)
+        post.text = 'Собаки грызут мячи'
+        post.save()
+        self.assertEqual(search.search('грызут'), [post.pk])
+        self.assertEqual(search.search('мяч любить'), [])
+        post.delete()
+        self.assertEqual(search.search('мячи'), [])
+
+    def test_postings_backend_ranks_by_frequency(self):
+        """Индекс без FTS5 ранжирует посты по частоте слов."""
+        backend = search.PostingsBackend()
+        for post in (self.cats, self.dogs):
+            backend.index(post)
+        self.assertEqual(
+            backend.search(['кошк', 'люб'], search.OR, 10),
+            [self.cats.pk, self.dogs.pk]
+        )
+        self.assertEqual(
+            backend.search(['кошк', 'кост'], search.AND, 10), []
+        )
+
+    def test_filter_posts_is_not_limited(self):
+        """Фильтр для админки находит все посты обоими индексами."""
+        backend = search.PostingsBackend()
+        for post in (self.cats, self.dogs):
+            backend.index(post)
+        posts = Post.objects.all()
+        for name, index in (
+            ('default', search.backend), ('postings', backend)
+        ):
+            with self.subTest(backend=name), override_settings(
+                SEARCH_MAX_RESULTS=1
+            ), mock.patch.object(search, 'backend', index):
+                self.assertCountEqual(
+                    search.filter_posts(posts, 'любят', search.AND),
+                    [self.cats, self.dogs]
+                )
+                self.assertCountEqual(
+                    search.filter_posts(posts, 'кошка любят'), [self.cats]
+                )
+                self.assertFalse(search.filter_posts(posts, 'и'))
+
+    def test_admin_search_finds_all_posts(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        client = Client()
+        client.force_login(admin)
+        with override_settings(SEARCH_MAX_RESULTS=1):
+            response = client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'любят'}
+            )
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_search_view_paginates_results(self):
+        """Страница поиска выводит найденные посты и сохраняет запрос
+        в ссылках паджинатора."""
+        Post.objects.bulk_create(
+            Post(text=f'кошки {i}', author=self.user) for i in range(12)
+        )
+        for post in Post.objects.all():
+            search.index_post(post)
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': 'кошка'}
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj.object_list), 10)
+        self.assertEqual(page_obj.paginator.count, 13)
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%88%D0%BA%D0%B0')
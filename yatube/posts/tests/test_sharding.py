@@ -0,0 +1,267 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .. import exporting, sharding
+from ..importing import POSTS, Importer
+from ..models import AuthorShard, Comment, Follow, Post
+from .test_images import SMALL_GIF
+
+User = get_user_model()
+SHARDS = ['default', 'shard_1']
+
+
+@override_settings(POST_SHARDS=SHARDS)
+class ShardingTest(TransactionTestCase):
+    databases = set(SHARDS)
+
+    def setUp(self):
+        # Соединения открыты до override_settings, проверку
+        # внешних ключей снимаем так же, как сигнал при подключении
+        for alias in SHARDS:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('PRAGMA foreign_keys = OFF')
+        cache.clear()
+        sharding._id_blocks.clear()
+        self.local = User.objects.create_user(username='local')
+        self.remote = User.objects.create_user(username='remote')
+        AuthorShard.objects.update_or_create(
+            user=self.local, defaults={'shard': 'default'}
+        )
+        AuthorShard.objects.update_or_create(
+            user=self.remote, defaults={'shard': 'shard_1'}
+        )
+        self.reader = User.objects.create_user(username='reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def tearDown(self):
+        for alias in SHARDS:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('PRAGMA foreign_keys = ON')
+
+    def test_posts_and_comments_are_stored_in_author_shard(self):
+        post = self.remote.posts.create(text='remote_text')
+        comment = post.comments.create(author=self.reader, text='comment')
+        self.assertEqual(post._state.db, 'shard_1')
+        self.assertTrue(
+            Comment.objects.using('shard_1').filter(pk=comment.pk).exists()
+        )
+        self.assertFalse(
+            Post.objects.using('default').filter(pk=post.pk).exists()
+        )
+
+    def test_manager_create_writes_to_author_shard(self):
+        post = Post.objects.create(text='remote_text', author=self.remote)
+        self.assertEqual(post._state.db, 'shard_1')
+        self.assertTrue(
+            Post.objects.using('shard_1').filter(pk=post.pk).exists()
+        )
+        self.assertFalse(
+            Post.objects.using('default').filter(pk=post.pk).exists()
+        )
+
+    def test_ids_are_unique_across_shards(self):
+        local = self.local.posts.create(text='local_text')
+        remote = self.remote.posts.create(text='remote_text')
+        self.assertNotEqual(local.pk, remote.pk)
+
+    def test_new_authors_are_placed_in_shards(self):
+        user = User.objects.create_user(username='new')
+        self.assertEqual(user.shard.shard, sharding.placement(user.pk))
+
+    def test_index_merges_shards_newest_first(self):
+        posts = [
+            author.posts.create(text=f'text_{number}')
+            for number, author in enumerate(
+                [self.remote, self.local, self.remote, self.local]
+            )
+        ]
+        response = self.client.get(reverse('posts:main_page'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), posts[::-1])
+        self.assertEqual(page_obj.paginator.count, len(posts))
+
+    @override_settings(SHOW_POSTS=2)
+    def test_index_pages_shards_by_cursor(self):
+        """Курсор листает посты всех шардов вперёд и назад."""
+        posts = [
+            author.posts.create(text=f'text_{number}')
+            for number, author in enumerate(
+                [self.remote, self.local, self.local, self.remote, self.local]
+            )
+        ]
+        url = reverse('posts:main_page')
+        pages = []
+        cursor = ''
+        while cursor is not None:
+            page_obj = self.client.get(
+                url, {'cursor': cursor}
+            ).context['page_obj']
+            pages.append(list(page_obj))
+            cursor = page_obj.next_cursor
+        self.assertEqual(sum(pages, []), posts[::-1])
+        page_obj = self.client.get(
+            url, {'cursor': page_obj.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(page_obj), pages[-2])
+
+    def test_post_detail_reads_remote_shard(self):
+        post = self.remote.posts.create(text='remote_text')
+        self.client.post(
+            reverse('posts:add_comment', args=(post.pk,)),
+            {'text': 'comment_text'}
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.pk,))
+        )
+        self.assertEqual(response.context['post'].author, self.remote)
+        comment, = response.context['comments']
+        self.assertEqual(comment.author, self.reader)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_follow_feed_reads_remote_shard(self):
+        Follow.objects.create(user=self.reader, author=self.remote)
+        post = self.remote.posts.create(text='remote_text')
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+
+    def test_image_commands_read_every_shard(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            post = self.remote.posts.create(
+                text='remote_text',
+                image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif')
+            )
+            Post.objects.using('shard_1').filter(pk=post.pk).update(
+                image_width=None, image_hash=''
+            )
+            call_command('fill_image_metadata', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.image_width, 2)
+
+    def test_move_authors_copies_and_removes_posts(self):
+        post = self.local.posts.create(text='local_text')
+        post.comments.create(author=self.reader, text='comment')
+        call_command(
+            'move_authors', author=['local'], to='shard_1', stdout=StringIO()
+        )
+        self.assertEqual(sharding.shard_of_user(self.local.pk), 'shard_1')
+        self.assertFalse(Post.objects.using('default').exists())
+        moved = Post.objects.using('shard_1').get(pk=post.pk)
+        self.assertEqual(moved.pub_date, post.pub_date)
+        self.assertEqual(moved.comments.count(), 1)
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.pk,))
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_interrupted_move_is_resumed(self):
+        """Перенос, прерванный после переключения, удаляет старые копии."""
+        post = self.local.posts.create(text='local_text')
+        AuthorShard.objects.filter(user=self.local).update(
+            moving_to='shard_1'
+        )
+        sharding._copy_author(self.local.pk, 'default', 'shard_1', 100)
+        sharding.move_author(self.local.pk, 'shard_1')
+        self.assertEqual(
+            AuthorShard.objects.get(user=self.local).moved_from, ''
+        )
+        self.assertFalse(Post.objects.using('default').exists())
+        self.assertTrue(
+            Post.objects.using('shard_1').filter(pk=post.pk).exists()
+        )
+
+    def test_move_keeps_edits_and_post_locations(self):
+        """Правка, попавшая в старый шард после копирования, переносится,
+        а шард поста, прочитанный во время переноса, не застревает
+        в кэше."""
+        post = self.local.posts.create(text='local_text')
+        AuthorShard.objects.filter(user=self.local).update(
+            moving_to='shard_1'
+        )
+        sharding._copy_author(self.local.pk, 'default', 'shard_1', 100)
+        Post.objects.using('default').filter(pk=post.pk).update(
+            text='edited_text'
+        )
+        self.assertEqual(sharding.shard_of_post(post.pk), 'default')
+        sharding.move_author(self.local.pk, 'shard_1')
+        self.assertEqual(sharding.shard_of_post(post.pk), 'shard_1')
+        self.assertEqual(
+            Post.objects.using('shard_1').get(pk=post.pk).text, 'edited_text'
+        )
+
+    def test_moving_author_posts_are_read_only(self):
+        post = self.local.posts.create(text='local_text')
+        AuthorShard.objects.filter(user=self.local).update(
+            moving_to='shard_1'
+        )
+        post.text = 'edited_text'
+        with self.assertRaises(sharding.AuthorMoving):
+            post.save()
+        with self.assertRaises(sharding.AuthorMoving):
+            post.comments.create(author=self.reader, text='comment')
+
+    def test_deleted_author_rows_leave_remote_shard(self):
+        post = self.remote.posts.create(text='remote_text')
+        post.comments.create(author=self.reader, text='comment')
+        local_post = self.local.posts.create(text='local_text')
+        self.remote.comments.create(post=local_post, text='comment')
+        self.remote.delete()
+        self.assertFalse(Post.objects.using('shard_1').exists())
+        self.assertFalse(Comment.objects.using('shard_1').exists())
+        self.assertFalse(Comment.objects.using('default').exists())
+        response = self.client.get(reverse('posts:main_page'))
+        self.assertEqual(list(response.context['page_obj']), [local_post])
+
+    def test_import_writes_posts_to_author_shards(self):
+        importer = Importer(POSTS)
+        importer.load([
+            {'author': 'local', 'text': 'local_text'},
+            {'author': 'remote', 'text': 'remote_text'},
+        ])
+        local = Post.objects.using('default').get()
+        remote = Post.objects.using('shard_1').get()
+        self.assertEqual(remote.text, 'remote_text')
+        self.assertNotEqual(local.pk, remote.pk)
+
+    def test_imported_ids_are_not_allocated_again(self):
+        issued = self.local.posts.create(text='local_text')
+        importer = Importer(POSTS)
+        importer.load([
+            {'id': issued.pk + 1000, 'author': 'remote', 'text': 'legacy'},
+            {'id': issued.pk, 'author': 'remote', 'text': 'taken'},
+        ])
+        self.assertEqual(importer.skipped, 1)
+        # Блок нового процесса начинается после загруженных id
+        sharding._id_blocks.clear()
+        post = self.local.posts.create(text='new_text')
+        self.assertGreater(post.pk, issued.pk + 1000)
+
+    def test_export_reads_all_shards(self):
+        self.local.posts.create(text='local_text')
+        self.remote.posts.create(text='remote_text')
+        rows = list(exporting.rows())
+        self.assertEqual(
+            [(row['author'], row['text']) for row in rows],
+            [('local', 'local_text'), ('remote', 'remote_text')]
+        )
+
+    def test_comments_export_reads_all_shards(self):
+        post = self.remote.posts.create(text='remote_text')
+        post.comments.create(author=self.reader, text='comment')
+        rows = list(exporting.rows(kind=exporting.COMMENTS))
+        self.assertEqual(
+            [(row['post'], row['author']) for row in rows],
+            [(post.pk, 'reader')]
+        )
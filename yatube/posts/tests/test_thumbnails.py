@@ -0,0 +1,196 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .. import thumbnails
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def png_file(name, color):
+    """Картинка с уникальным для цвета содержимым."""
+    content = BytesIO()
+    Image.new('RGB', (2, 1), color).save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(), 'image/png')
+
+
+def run_on_commit(func):
+    func()
+
+
+def stored(image_name):
+    """Запись хранилища ключей об изображении или None."""
+    return default.kvstore.get(ImageFile(image_name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test_username')
+        cls.guest_client = Client()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.clear_local()
+        self.post = Post.objects.create(
+            text='test_text',
+            author=self.user,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    def test_render_does_not_resize(self):
+        """Без готовой миниатюры показывается оригинал, а генерация
+        ставится в очередь."""
+        with mock.patch.object(thumbnails, 'submit') as submit:
+            response = self.guest_client.get(
+                reverse('posts:post_detail', args=(self.post.pk,))
+            )
+        self.assertContains(response, self.post.image.url)
+        submit.assert_called_once()
+        self.assertEqual(submit.call_args[0][0], self.post.image.name)
+        self.assertIsNone(stored(self.post.image.name))
+
+    def test_generated_thumbnails_are_shown(self):
+        """Карточка поста получает srcset миниатюр WebP и JPEG."""
+        thumbnails.generate(self.post.image.name)
+        self.post.refresh_from_db()
+        renditions = thumbnails.get_renditions(self.post)
+        self.assertEqual(set(renditions), {'webp', 'jpeg'})
+        width, height, webp_name = renditions['webp'][0]
+        self.assertEqual((width, height), (320, 113))
+        self.assertTrue(webp_name.endswith('.webp'))
+        with mock.patch.object(thumbnails, 'submit') as submit:
+            response = self.guest_client.get(reverse('posts:main_page'))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, f'/media/{webp_name} 320w')
+        submit.assert_not_called()
+
+    def test_widths_do_not_exceed_original(self):
+        """Миниатюры шире оригинала не создаются."""
+        content = BytesIO()
+        Image.new('RGB', (1000, 400)).save(content, 'PNG')
+        post = Post.objects.create(
+            text='wide_text',
+            author=self.user,
+            image=SimpleUploadedFile('wide.png', content.getvalue()),
+        )
+        renditions = thumbnails.generate(post.image.name)
+        self.assertEqual(
+            [width for width, _, _ in renditions['jpeg']], [320, 640, 960]
+        )
+
+    def test_new_image_resets_renditions(self):
+        """Замена картинки сбрасывает описание старых миниатюр."""
+        thumbnails.generate(self.post.image.name)
+        self.post.refresh_from_db()
+        self.post.image = png_file('other.png', (0, 255, 0))
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image_renditions, '')
+
+    @mock.patch.object(thumbnails.transaction, 'on_commit', run_on_commit)
+    def test_new_image_is_scheduled_after_commit(self):
+        """Генерация запускается для нового изображения,
+        но не при правке текста."""
+        with mock.patch.object(thumbnails, 'submit') as submit:
+            post = Post.objects.create(
+                text='new_text',
+                author=self.user,
+                image=png_file('new.png', (255, 0, 0)),
+            )
+            post.text = 'edited_text'
+            post.save()
+        submit.assert_called_once()
+        self.assertEqual(submit.call_args[0][0], post.image.name)
+
+    def test_backfill_command(self):
+        """Команда создаёт миниатюры существующих изображений."""
+        call_command('generate_thumbnails', workers=0, stdout=mock.Mock())
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.image_renditions)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class LRUKVStoreTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        user = User.objects.create_user(username='Test_username')
+        cls.names = []
+        for i in range(3):
+            post = Post.objects.create(
+                text=f'test_text_{i}',
+                author=user,
+                image=png_file(f'small_{i}.png', (i, 0, 0)),
+            )
+            thumbnails.generate(post.image.name)
+            cls.names.append(post.image.name)
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.clear_local()
+        default.kvstore.reset_metrics()
+
+    def test_repeated_lookup_is_served_from_memory(self):
+        """Повторный поиск не обращается ни к кэшу, ни к базе."""
+        for name in self.names:
+            stored(name)
+        cache.clear()
+        with self.assertNumQueries(0):
+            found = [stored(name) for name in self.names]
+        self.assertNotIn(None, found)
+        metrics = default.kvstore.get_metrics()
+        self.assertEqual(metrics['hits'], 3)
+        self.assertEqual(metrics['misses'], 3)
+
+    def test_missing_thumbnail_is_not_remembered(self):
+        """Миниатюра, созданная другим процессом после промаха,
+        находится сразу."""
+        post = Post.objects.create(
+            text='new_text',
+            author=User.objects.get(username='Test_username'),
+            image=png_file('new.png', (0, 0, 255)),
+        )
+        self.assertIsNone(stored(post.image.name))
+        # Другой процесс пишет только в базу, не в наши кэши
+        store = default.kvstore._wrapped
+        with mock.patch.object(store.cache, 'set'), \
+                mock.patch.object(store, '_local_set'):
+            thumbnails.generate(post.image.name)
+        self.assertIsNotNone(stored(post.image.name))
+
+    @override_settings(THUMBNAIL_LRU_SIZE=2)
+    def test_lru_size_is_bounded(self):
+        """В памяти хранится не больше THUMBNAIL_LRU_SIZE записей."""
+        for name in self.names:
+            stored(name)
+        self.assertEqual(default.kvstore.get_metrics()['size'], 2)
@@ -1,16 +1,29 @@
+import shutil
+import tempfile
+import warnings
+
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.paginator import UnorderedObjectListWarning
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 from django.core.cache import cache
 
-from ..models import Group, Post
+from ..caching import feed_scope, page_cache_key
+from ..conditional import post_last_modified
+from ..models import Comment, Follow, Group, Post
 
 User = get_user_model()
 
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+# Миниатюры создаются в процессе теста, иначе фоновая генерация
+# сбрасывает кэш страниц в непредсказуемый момент
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class UserViewTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -45,6 +58,15 @@ class UserViewTest(TestCase):
         cls.authorized_client = Client()
         cls.authorized_client.force_login(cls.user)
 
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Откаты транзакций между тестами не сбрасывают кэш страниц
+        cache.clear()
+
     def test_pages_uses_correct_template(self):
         """URL-адрес использует соответствующий шаблон."""
         cache.clear()
@@ -81,11 +103,13 @@ class UserViewTest(TestCase):
                 self.assertEqual(obj, expected)
 
     def test_main_page_cache(self):
-        """Проверка: объекты страницы main_page кэшируются"""
+        """Проверка: main_page кэшируется до изменения постов."""
         cache.clear()
         response_one = self.guest_client.get(reverse('posts:main_page'))
-        response_one_obj_content = response_one.content
-        response_one.context['page_obj'][0].delete()
+        response_two = self.guest_client.get(reverse('posts:main_page'))
+        # Из кэша страница отдаётся без рендеринга шаблона
+        self.assertIsNone(response_two.context)
+        self.assertEqual(response_one.content, response_two.content)
         form_data = {
             'text': 'Тестовый пост для проверки кэширования',
         }
@@ -94,15 +118,31 @@ class UserViewTest(TestCase):
             data=form_data,
             follow=True
         )
-        response_two = self.guest_client.get(reverse('posts:main_page'))
-        response_two_obj_content = response_two.content
-        self.assertEqual(response_one_obj_content, response_two_obj_content)
-        cache.clear()
         response_three = self.guest_client.get(reverse('posts:main_page'))
-        response_three_obj_content = response_three.content
-        self.assertNotEqual(
-            response_two_obj_content, response_three_obj_content
+        self.assertNotEqual(response_two.content, response_three.content)
+        self.assertContains(response_three, form_data['text'])
+
+    def test_group_and_profile_cache_reset_on_post_delete(self):
+        """Проверка: удаление поста сразу сбрасывает кэш group_list
+        и profile.
+        """
+        cache.clear()
+        urls = (
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
         )
+        for url in urls:
+            self.guest_client.get(url)
+        post = Post.objects.create(
+            text='Пост для удаления', author=self.user, group=self.group
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), post.text)
+        post.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(self.guest_client.get(url), post.text)
 
     def test_group_list_page_correct_context(self):
         """Проверка словаря context на странице group_list."""
@@ -293,6 +333,14 @@ class UserViewTest(TestCase):
         self.assertRedirects(response_auth_2, redirect_auth)
         self.assertRedirects(response_not_auth, redirect_not_auth)
 
+    def test_follow_resets_follower_profile_cache(self):
+        """Подписка сразу меняет число подписок в профиле подписчика."""
+        user = User.objects.create_user(username='username_1')
+        url = reverse('posts:profile', args=(user.username,))
+        self.assertContains(self.guest_client.get(url), 'подписок: 0')
+        Follow.objects.create(user=user, author=self.user)
+        self.assertContains(self.guest_client.get(url), 'подписок: 1')
+
     def test_new_post_is_on_the_follow_index_page(self):
         """Новая запись пользователя появляется в ленте тех,
         кто на него подписан и не появляется в ленте тех, кто не подписан.
@@ -314,3 +362,178 @@ class UserViewTest(TestCase):
         )
         self.assertContains(response_user_1, self.post.text)
         self.assertNotContains(response_user_2, self.post.text)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='test_group',
+            slug='test_slug',
+            description='test_description',
+        )
+        cls.user = User.objects.create_user(username='Test_username')
+        cls.follower = User.objects.create_user(username='Test_follower')
+        Follow.objects.create(user=cls.follower, author=cls.user)
+        cls.guest_client = Client()
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.follower)
+
+    def create_posts(self, count):
+        for i in range(count):
+            Post.objects.create(
+                text=f'test_text_{i}', author=self.user, group=self.group
+            )
+
+    def test_feed_queries_do_not_depend_on_post_count(self):
+        """Число запросов лент не зависит от числа постов на странице."""
+        pages = (
+            (self.guest_client, reverse('posts:main_page'), 2),
+            (
+                self.guest_client,
+                reverse('posts:group_list', args=(self.group.slug,)),
+                2
+            ),
+            (
+                self.guest_client,
+                reverse('posts:profile', args=(self.user.username,)),
+                2
+            ),
+            (self.authorized_client, reverse('posts:follow_index'), 6),
+        )
+        for posts_count in (1, settings.SHOW_POSTS):
+            self.create_posts(posts_count)
+            for client, url, queries in pages:
+                with self.subTest(url=url, posts_count=posts_count):
+                    cache.clear()
+                    with self.assertNumQueries(queries):
+                        client.get(url)
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test_username')
+        cls.post = Post.objects.create(text='test_text', author=cls.user)
+        for i in range(settings.SHOW_COMMENTS + 5):
+            commentator = User.objects.create_user(username=f'user_{i}')
+            Comment.objects.create(
+                text=f'comment_{i}', author=commentator, post=cls.post
+            )
+        cls.guest_client = Client()
+
+    def test_comments_are_paginated_with_fragment(self):
+        """Комментарии выводятся страницами, следующая - фрагментом."""
+        response = self.guest_client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        comments = response.context['comments']
+        self.assertEqual(len(comments.object_list), settings.SHOW_COMMENTS)
+        self.assertEqual(comments.object_list[0].text, 'comment_0')
+        fragment = self.guest_client.get(
+            reverse('posts:post_comments', args=(self.post.pk,)),
+            {'cursor': comments.next_cursor}
+        )
+        self.assertTemplateUsed(fragment, 'includes/comments.html')
+        self.assertTemplateNotUsed(fragment, 'base.html')
+        self.assertEqual(len(fragment.context['comments'].object_list), 5)
+        self.assertContains(fragment, 'comment_24')
+
+    def test_comments_page_is_ordered(self):
+        """Страница комментариев строится по упорядоченному запросу."""
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            self.guest_client.get(
+                reverse('posts:post_comments', args=(self.post.pk,))
+            )
+
+    def test_comment_authors_are_joined(self):
+        """Авторы комментариев загружаются одним запросом с ними."""
+        with self.assertNumQueries(2):
+            self.guest_client.get(
+                reverse('posts:post_comments', args=(self.post.pk,))
+            )
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test_username')
+        cls.post = Post.objects.create(text='test_text', author=cls.user)
+        cls.guest_client = Client()
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_feed_is_not_modified(self):
+        """Лента без изменений отвечает 304 без рендеринга."""
+        url = reverse('posts:main_page')
+        etag = self.guest_client.get(url)['ETag']
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIsNone(response.context)
+        Post.objects.create(text='new_text', author=self.user)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_previous_generation_page_keeps_its_etag(self):
+        """Страница прошлого поколения, отданная во время перестроения,
+        не получает ETag новой и не закрепляется ответами 304."""
+        url = reverse('posts:main_page')
+        old_etag = self.guest_client.get(url)['ETag']
+        Post.objects.create(text='new_text', author=self.user)
+        key = page_cache_key(
+            RequestFactory().get(url), 'index', [feed_scope('index')]
+        )
+        cache.add(f'{key}:lock', 1)
+        response = self.guest_client.get(url)
+        self.assertNotContains(response, 'new_text')
+        self.assertEqual(response['ETag'], old_etag)
+        cache.delete(f'{key}:lock')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=old_etag)
+        self.assertContains(response, 'new_text')
+        self.assertNotEqual(response['ETag'], old_etag)
+
+    def test_feed_etag_depends_on_user(self):
+        """Гость и пользователь получают разные ETag одной ленты."""
+        url = reverse('posts:profile', args=(self.user.username,))
+        self.assertNotEqual(
+            self.guest_client.get(url)['ETag'],
+            self.authorized_client.get(url)['ETag']
+        )
+
+    def test_unchanged_post_is_not_modified(self):
+        """Страница поста отвечает 304, пока нет новых комментариев."""
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        response = self.guest_client.get(url)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.guest_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(
+            text='comment', author=self.user, post=self.post
+        )
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_comment_deletion_moves_last_modified(self):
+        comment = Comment.objects.create(
+            text='comment', author=self.user, post=self.post
+        )
+        request = RequestFactory().get('/')
+        commented = post_last_modified(request, self.post.pk)
+        comment.delete()
+        request = RequestFactory().get('/')
+        self.assertGreater(
+            post_last_modified(request, self.post.pk), commented
+        )
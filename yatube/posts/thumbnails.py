@@ -0,0 +1,200 @@
+import json
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+
+from . import sharding
+from .caching import bump_generations, feed_scope
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+backend = ThumbnailBackend()
+
+_executor = None
+_executor_lock = threading.Lock()
+# Изображения в очереди: колбэки пула выполняются в его потоке
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _geometry(width):
+    aspect_width, aspect_height = settings.THUMBNAIL_ASPECT
+    return f'{width}x{round(width * aspect_height / aspect_width)}'
+
+
+def _options(format_):
+    return {'crop': 'center', 'upscale': True, 'format': format_}
+
+
+def _widths(image_name):
+    """Ширины миниатюр, не превышающие ширину оригинала.
+
+    Самая узкая миниатюра создаётся всегда.
+    """
+    with default_storage.open(image_name) as image_file:
+        source_width = Image.open(image_file).width
+    widths = sorted(settings.THUMBNAIL_WIDTHS)
+    return [widths[0]] + [
+        width for width in widths[1:] if width <= source_width
+    ]
+
+
+def generate(image_name):
+    """Создаёт миниатюры изображения всех ширин и форматов.
+
+    Описание миниатюр сохраняется в image_renditions постов
+    с этим изображением: {формат: [[ширина, высота, имя файла], ...]}.
+    """
+    renditions = {}
+    widths = _widths(image_name)
+    for format_ in settings.THUMBNAIL_FORMATS:
+        renditions[format_.lower()] = [
+            [*thumbnail.size, thumbnail.name]
+            for thumbnail in (
+                backend.get_thumbnail(
+                    image_name, _geometry(width), **_options(format_)
+                )
+                for width in widths
+            )
+        ]
+    for posts in sharding.querysets(Post):
+        posts.filter(image=image_name).update(
+            image_renditions=json.dumps(renditions)
+        )
+    return renditions
+
+
+def init_worker():
+    """Готовит процесс пула к работе с Django.
+
+    Соединения с базой, унаследованные от родительского процесса,
+    закрываются: каждый процесс открывает свои.
+    """
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                initializer=init_worker
+            )
+        return _executor
+
+
+def post_scopes(post):
+    """Области кэша лент, в которых показывается пост."""
+    scopes = [feed_scope('index'), feed_scope('author', post.author.username)]
+    if post.group_id is not None:
+        scopes.append(feed_scope('group', post.group.slug))
+    return scopes
+
+
+def _done(image_name, scopes, future):
+    with _pending_lock:
+        _pending.discard(image_name)
+    if future.exception() is not None:
+        logger.error(
+            'Не удалось создать миниатюры %s', image_name,
+            exc_info=future.exception()
+        )
+        return
+    # Страницы лент, закэшированные со ссылкой на оригинал,
+    # перестраиваются уже с миниатюрами
+    bump_generations(*scopes)
+
+
+def submit(image_name, scopes=()):
+    """Ставит генерацию миниатюр в очередь пула процессов.
+
+    Изображение, которое уже обрабатывается, повторно не ставится.
+    После генерации сбрасывается кэш страниц областей scopes.
+    При THUMBNAIL_WORKERS = 0 миниатюры создаются сразу.
+    """
+    if not settings.THUMBNAIL_WORKERS:
+        generate(image_name)
+        return
+    with _pending_lock:
+        if image_name in _pending:
+            return
+        _pending.add(image_name)
+    future = _get_executor().submit(generate, image_name)
+    future.add_done_callback(
+        lambda future: _done(image_name, scopes, future)
+    )
+
+
+def schedule(post):
+    """Генерирует миниатюры поста после фиксации транзакции."""
+    if post.image:
+        image_name = post.image.name
+        scopes = post_scopes(post)
+        transaction.on_commit(lambda: submit(image_name, scopes))
+
+
+def _srcset(renditions):
+    return ', '.join(
+        f'{default.storage.url(name)} {width}w'
+        for width, _, name in renditions
+    )
+
+
+def get_renditions(post):
+    """Описание миниатюр поста из image_renditions или пустой словарь."""
+    if not post.image_renditions:
+        return {}
+    return json.loads(post.image_renditions)
+
+
+def picture(post):
+    """Данные для тега <picture> с изображением поста.
+
+    Адреса и размеры миниатюр берутся из image_renditions, файлы
+    не проверяются. Пока миниатюр нет, показывается оригинал,
+    а генерация ставится в очередь; сам запрос изображение
+    не обрабатывает (кроме режима THUMBNAIL_WORKERS = 0).
+    """
+    renditions = get_renditions(post)
+    if not renditions and not settings.THUMBNAIL_WORKERS:
+        renditions = generate(post.image.name)
+        post.image_renditions = json.dumps(renditions)
+    if not renditions:
+        submit(post.image.name, post_scopes(post))
+        return {'ready': False, 'src': post.image.url}
+    # Последний формат - запасной для браузеров без поддержки остальных
+    formats = [format_.lower() for format_ in settings.THUMBNAIL_FORMATS]
+    fallback = renditions[formats[-1]]
+    suitable = [
+        rendition for rendition in fallback
+        if rendition[0] <= settings.THUMBNAIL_DEFAULT_WIDTH
+    ]
+    width, height, name = suitable[-1] if suitable else fallback[0]
+    return {
+        'ready': True,
+        'src': default.storage.url(name),
+        'width': width,
+        'height': height,
+        'srcset': _srcset(fallback),
+        'sizes': settings.THUMBNAIL_SIZES,
+        'sources': [
+            {
+                'type': f'image/{format_}',
+                'srcset': _srcset(renditions[format_]),
+            }
+            for format_ in formats[:-1] if renditions.get(format_)
+        ],
+    }
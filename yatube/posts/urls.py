@@ -8,6 +8,7 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='main_page'),
+    path('search/', views.search, name='search'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     # Профайл пользователя
     path('profile/<str:username>/', views.profile, name='profile'),
@@ -18,7 +19,13 @@ urlpatterns = [
     path(
         'posts/<int:post_id>/comment/', views.add_comment, name='add_comment'
     ),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('export/posts/', views.export_posts, name='export_posts'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
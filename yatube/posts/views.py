@@ -1,26 +1,39 @@
+from urllib.parse import urlencode
+
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import condition
 
+from . import exporting
+from . import search as post_search
+from .caching import cache_feed
+from .conditional import feed_etag, post_etag, post_last_modified
+from .feed import followed_feed
 from .forms import CommentForm, PostForm
-from .models import Group, Post, User, Follow
-from django.views.decorators.cache import cache_page
-from .paginator import get_paginator
+from .models import Group, Post, User, Follow, with_related
+from .paginator import count_cache_key, get_comments_page, get_paginator
+from .sharding import feed_posts, post_queryset
 
 
-@cache_page(20, key_prefix='index_page')
+@condition(etag_func=feed_etag('index'))
+@cache_feed('index')
 def index(request):
-    post_list = Post.objects.all()
-    page_obj = get_paginator(post_list, request)
+    post_list = feed_posts(Post.objects.all())
+    page_obj = get_paginator(post_list, request, count_cache_key())
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=feed_etag('group', 'slug'))
+@cache_feed('group', 'slug')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page_obj = get_paginator(post_list, request)
+    post_list = feed_posts(group.posts.all())
+    page_obj = get_paginator(post_list, request, count=group.posts_count)
     context = {
         'page_obj': page_obj,
         'group': group,
@@ -28,30 +41,51 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=feed_etag('author', 'username'))
+@cache_feed('author', 'username')
 def profile(request, username):
-    following = False
     # Здесь код запроса к модели и создание словаря контекста
-    author = get_object_or_404(User, username=username)
-    post_list = Post.objects.filter(author=author)
-    post_count = author.posts.count()
-    page_obj = get_paginator(post_list, request)
-    # Проверки, подписан ли пользователь на автора
-    if request.user.is_authenticated:
-        if Follow.objects.filter(user=request.user, author=author).count():
-            following = True
+    author = get_object_or_404(
+        User.objects.select_related('counters'), username=username
+    )
+    post_list = author.posts.for_feed()
+    post_count = author.counters.posts_count
+    page_obj = get_paginator(post_list, request, count=post_count)
+    # Кнопка подписки зависит от пользователя и подставляется
+    # в закэшированную страницу фрагментом follow
     context = {
         'page_obj': page_obj,
         'author': author,
         'post_count': post_count,
-        'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    mode = post_search.OR if request.GET.get('mode') == 'or' else (
+        post_search.AND
+    )
+    results = post_search.SearchResults(post_search.search(query, mode))
+    page_obj = get_paginator(results, request)
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+        'mode': mode,
+        # Параметры запроса для ссылок паджинатора
+        'extra_query': urlencode({'q': query, 'mode': mode}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        with_related(post_queryset(post_id), 'author__counters', 'group'),
+        pk=post_id
+    )
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = get_comments_page(post, request)
     context = {
         'post': post,
         'form': form,
@@ -60,6 +94,16 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующая страница комментариев поста: фрагмент HTML."""
+    post = get_object_or_404(post_queryset(post_id).only('pk'), pk=post_id)
+    context = {
+        'post': post,
+        'comments': get_comments_page(post, request),
+    }
+    return render(request, 'includes/comments.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -76,7 +120,7 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(post_queryset(post_id), pk=post_id)
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
@@ -98,7 +142,7 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(post_queryset(post_id), pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -110,9 +154,7 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(
-        author__in=request.user.follower.values_list('author', flat=True)
-    )
+    post_list = followed_feed(request.user)
     page_obj = get_paginator(post_list, request)
     context = {
         'page_obj': page_obj
@@ -132,3 +174,28 @@ def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     Follow.objects.get(user=request.user, author=author).delete()
     return redirect('posts:profile', username=username)
+
+
+@staff_member_required
+def export_posts(request):
+    """Выгрузка всех постов или комментариев (?kind=comments):
+    ?format=jsonl|csv, ?gzip=1 - со сжатием."""
+    format_ = request.GET.get('format')
+    if format_ not in exporting.FORMATS:
+        format_ = exporting.JSONL
+    kind = request.GET.get('kind')
+    if kind not in exporting.KINDS:
+        kind = exporting.POSTS
+    compress = request.GET.get('gzip') == '1'
+    response = StreamingHttpResponse(
+        exporting.export(format_, compress, kind=kind),
+        content_type=(
+            'application/gzip' if compress
+            else exporting.CONTENT_TYPES[format_]
+        )
+    )
+    response['Content-Disposition'] = (
+        'attachment; '
+        f'filename="{exporting.filename(format_, compress, kind)}"'
+    )
+    return response
@@ -1,6 +1,46 @@
 import os
 
 SHOW_POSTS = 10   # Количество отображаемых постов на странице
+SHOW_COMMENTS = 20   # Количество комментариев на странице поста
+# Режим паджинации лент: 'page' - по номерам страниц,
+# 'cursor' - по ключу (pub_date, id) без COUNT и OFFSET
+PAGINATION_MODE = 'page'
+# Сколько постов считать точно, если числа нет в кэше
+POST_COUNT_LIMIT = 1000
+# Время жизни закэшированного числа постов ленты, сек.
+POST_COUNT_TIMEOUT = 60 * 60
+# Лента подписок: авторы с большим числом подписчиков
+# не рассылают посты, а подмешиваются в ленту при чтении
+FEED_FANOUT_LIMIT = 1000
+# Сколько последних постов автора добавить в ленту при подписке
+FEED_BACKFILL_SIZE = 200
+FEED_BATCH_SIZE = 500
+# Время жизни страниц лент в кэше, сек. Кэш сбрасывается
+# сразу при изменении постов, поэтому время может быть большим
+FEED_CACHE_TIMEOUT = 60 * 60
+# Сколько ещё отдавать устаревшую страницу, пока она перестраивается
+FEED_CACHE_GRACE = 60
+# Блокировка перестроения страницы и ожидание её снятия, сек.
+FEED_CACHE_LOCK_TIMEOUT = 10
+FEED_CACHE_LOCK_WAIT = 2
+# Сколько лучших результатов поиска показывать
+SEARCH_MAX_RESULTS = 1000
+# Время жизни отрендеренных карточек постов, сек.
+POST_CARD_TIMEOUT = 60 * 60 * 24
+# Миниатюры изображений постов: ширины, пропорции кадра и форматы.
+# Последний формат - запасной для браузеров без поддержки остальных
+THUMBNAIL_WIDTHS = (320, 640, 960, 1920)
+THUMBNAIL_ASPECT = (960, 339)
+THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+# Ширина миниатюры в src и ширина картинки на странице для sizes
+THUMBNAIL_DEFAULT_WIDTH = 960
+THUMBNAIL_SIZES = '(min-width: 992px) 960px, 100vw'
+# Процессов генерации миниатюр; 0 - генерировать в текущем процессе
+THUMBNAIL_WORKERS = 2
+# Хранилище ключей sorl-thumbnail с LRU-кэшем в памяти процесса
+THUMBNAIL_KVSTORE = 'posts.kvstore.LRUKVStore'
+THUMBNAIL_LRU_SIZE = 1000
+THUMBNAIL_LRU_TIMEOUT = 60 * 5
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -15,9 +55,17 @@ ALLOWED_HOSTS = [
     'testserver',
 ]
 
+# L1 в памяти каждого процесса, общий L2 - файл SQLite
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.TwoTierCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'SYNC_INTERVAL': 1,
+        },
     }
 }
 
@@ -37,6 +85,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.PrimaryStickyMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,6 +124,65 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: пути к копиям базы через запятую
+# в YATUBE_DB_REPLICAS, копии обновляет команда sync_replicas
+DATABASE_REPLICAS = []
+REPLICA_PATHS = os.environ.get('YATUBE_DB_REPLICAS', '').split(',')
+for path in filter(None, REPLICA_PATHS):
+    alias = f'replica_{len(DATABASE_REPLICAS) + 1}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+# Модели лент и страниц постов, которые читаются с реплик;
+# сессии, пользователи и админка всегда читаются с основной базы
+REPLICA_MODELS = [
+    'posts.post', 'posts.comment', 'posts.group', 'posts.feedentry',
+    'posts.follow', 'posts.usercounters',
+]
+
+# Шарды постов и комментариев по авторам: пути к файлам баз
+# через запятую в YATUBE_POST_SHARDS. Основная база - первый шард,
+# в ней же остаются пользователи, группы, подписки и ленты
+POST_SHARDS = []
+SHARD_PATHS = os.environ.get('YATUBE_POST_SHARDS', '').split(',')
+for path in filter(None, SHARD_PATHS):
+    alias = f'shard_{len(POST_SHARDS) + 1}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+    }
+    POST_SHARDS.append(alias)
+if POST_SHARDS:
+    POST_SHARDS.insert(0, 'default')
+# Сколько идентификаторов постов и комментариев процесс
+# резервирует за раз, когда шардирование включено
+SHARD_ID_BLOCK = 100
+DATABASE_ROUTERS = [
+    'posts.sharding.ShardRouter',
+    'core.replicas.PrimaryReplicaRouter',
+]
+
+# SQLite рабочего профиля: запись не блокирует чтение (WAL),
+# fsync только на контрольных точках, чтение через mmap
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # Отрицательное значение - в КиБ
+    'busy_timeout': 5000,  # мс
+}
+# Профиль базы из YATUBE_DB_PROFILE: production включает
+# настройки выше и постоянные соединения
+DATABASE_PROFILE = os.environ.get('YATUBE_DB_PROFILE', 'development')
+SQLITE_PRAGMAS = {}
+if DATABASE_PROFILE == 'production':
+    SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+    for database in DATABASES.values():
+        database['CONN_MAX_AGE'] = 60
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
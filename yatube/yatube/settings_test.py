@@ -0,0 +1,23 @@
+"""Настройки для тестов: python manage.py test --settings=yatube.settings_test.
+
+Кэш - база в памяти процесса, чтобы тесты не видели кэш прошлых
+запусков. Реплики не подключаются: TestCase не видит из другого
+соединения свои незафиксированные данные. Шард shard_1 нужен
+тестам шардирования, его включает override_settings(POST_SHARDS=...).
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, CACHES, DATABASES
+
+CACHES['default']['LOCATION'] = ':memory:'
+
+DATABASE_REPLICAS = []
+DATABASES = {
+    'default': DATABASES['default'],
+    'shard_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'shard_1.sqlite3'),
+    },
+}
+POST_SHARDS = []